@@ -0,0 +1,413 @@
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+from functools import partial
+from generator import generate, seeded
+from parsing import parse_file
+
+TIERS = {
+    'easy': {1: 1, 2: 3},
+    'medium': {1: 1, 2: 3, 3: 2},
+    'hard': {2: 2, 3: 3, 4: 2},
+}
+
+WIDTHS = range(3, 13)
+
+
+def generate_corpus(directory, seed=0, widths=WIDTHS, tiers=TIERS, count=5):
+    """
+    Writes a reproducible corpus of .kk puzzle files
+
+    Every puzzle is generated from its own generator seeded by the corpus
+    seed, width, tier and index, so the same arguments always produce the
+    same files
+
+    Args:
+        directory (str): output directory
+        seed (int): corpus seed
+        widths (iter): puzzle widths
+        tiers (iter): difficulty tier names, keys of TIERS
+        count (int): puzzles per width and tier
+
+    Returns: list of the written filenames
+
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    filenames = []
+    for width in widths:
+        for tier in tiers:
+            for i in range(count):
+                rng = seeded(seed, width, tier, i)
+                spec = generate(width, rng, TIERS[tier])
+
+                filename = os.path.join(
+                    directory, 'w{0:02d}_{1}_{2:03d}.kk'.format(width, tier, i)
+                )
+                with open(filename, 'w') as f:
+                    f.write(repr(spec) + '\n')
+                filenames.append(filename)
+
+    return filenames
+
+
+def measure(filename, solve, warmup=1, repeat=5):
+    """
+    Benchmarks parsing and solving one puzzle file
+
+    Timed runs are preceded by warmup runs and made with garbage
+    collection disabled. Peak memory is measured in a separate, untimed
+    run, since tracing allocations slows the solver down.
+
+    Args:
+        filename (str): input .kk filename
+        solve (callable): solver returning (solved, stats)
+        warmup (int): untimed runs before measuring
+        repeat (int): timed runs
+
+    Returns: dict of per puzzle results
+
+    """
+    for _ in range(warmup):
+        solve(parse_file(filename))
+
+    times = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            ts = time.perf_counter()
+            solved, stats = solve(parse_file(filename))
+            times.append(time.perf_counter() - ts)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    try:
+        solve(parse_file(filename))
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'solved': solved,
+        'times': times,
+        'median': statistics.median(times),
+        'backtracks': stats.get('backtracks'),
+        'recursive_calls': stats.get('recursive_calls'),
+        'peak_memory': peak,
+    }
+
+
+def run_benchmark(filenames, solver='backtrack', warmup=1, repeat=5,
+                  output=print, variable_order=None, value_order=None):
+    """
+    Benchmarks a solver over a set of puzzle files
+
+    Args:
+        filenames (list): input .kk filenames
+        solver (str): one of the keys of `puzzle.SOLVERS`
+        warmup (int): untimed runs per puzzle
+        repeat (int): timed runs per puzzle
+        output (callable): function to output progress messages
+        variable_order (str): optional `Search` variable ordering
+        value_order (str): optional `Search` value ordering
+
+    Returns: dict with the run 'meta' data and the 'puzzles' results keyed
+             by file name
+
+    """
+    from puzzle import SOLVERS
+
+    solve = SOLVERS[solver]
+
+    options = {}
+    if variable_order is not None:
+        options['variable_order'] = variable_order
+    if value_order is not None:
+        options['value_order'] = value_order
+    if options:
+        solve = partial(solve, **options)
+
+    results = {}
+    for filename in filenames:
+        name = os.path.basename(filename)
+        results[name] = measure(filename, solve, warmup, repeat)
+        output('{0} {1:.6f} sec'.format(name, results[name]['median']))
+
+    return {
+        'meta': {
+            'solver': solver,
+            'variable_order': variable_order,
+            'value_order': value_order,
+            'warmup': warmup,
+            'repeat': repeat,
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'puzzles': results,
+    }
+
+
+def betacf(a, b, x):
+    """
+    Evaluates the continued fraction of the incomplete beta function with
+    the modified Lentz method
+
+    Returns: float
+
+    """
+    tiny = 1e-300
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1)
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+
+    for m in range(1, 300):
+        for numerator in (
+            m * (b - m) * x / ((a + 2 * m - 1) * (a + 2 * m)),
+            -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1))
+        ):
+            d = 1.0 + numerator * d
+            d = 1.0 / (d if abs(d) > tiny else tiny)
+            c = 1.0 + numerator / c
+            c = c if abs(c) > tiny else tiny
+            h *= d * c
+
+        if abs(d * c - 1.0) < 1e-12:
+            break
+
+    return h
+
+
+def betainc(a, b, x):
+    """
+    Returns the regularized incomplete beta function I_x(a, b)
+
+    Returns: float
+
+    """
+    if x <= 0:
+        return 0.0
+    if x >= 1:
+        return 1.0
+
+    front = math.exp(
+        math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) +
+        a * math.log(x) + b * math.log(1 - x)
+    )
+
+    if x < (a + 1) / (a + b + 2):
+        return front * betacf(a, b, x) / a
+    return 1.0 - front * betacf(b, a, 1 - x) / b
+
+
+def welch(baseline, current):
+    """
+    One sided Welch's t-test that `current` samples are larger (slower)
+    than `baseline` samples
+
+    See https://en.wikipedia.org/wiki/Welch%27s_t-test for more
+    information on this test
+
+    Args:
+        baseline (list): baseline timings, at least two
+        current (list): current timings, at least two
+
+    Returns: float the p-value
+
+    """
+    na, nb = len(baseline), len(current)
+    va = statistics.variance(baseline) / na
+    vb = statistics.variance(current) / nb
+    difference = statistics.mean(current) - statistics.mean(baseline)
+
+    if va + vb == 0:
+        return 0.0 if difference > 0 else 1.0
+
+    t = difference / math.sqrt(va + vb)
+    df = (va + vb) ** 2 / (va ** 2 / (na - 1) + vb ** 2 / (nb - 1))
+
+    tail = betainc(df / 2, 0.5, df / (df + t * t)) / 2
+    return tail if t > 0 else 1.0 - tail
+
+
+def compare(baseline, current, alpha=0.01, threshold=0.05):
+    """
+    Compares two benchmark runs puzzle by puzzle
+
+    A puzzle is a timing regression when its current timings are
+    significantly slower by Welch's t-test at level `alpha`, and its
+    median slowed down by more than `threshold`. A puzzle that now needs
+    more search work ('backtracks' or 'recursive_calls') is always
+    reported, since those counters are deterministic.
+
+    Args:
+        baseline (dict): stored `run_benchmark` results
+        current (dict): new `run_benchmark` results
+        alpha (float): significance level
+        threshold (float): minimum relative slowdown to report
+
+    Returns: dict with the 'regressions', the search 'work' increases,
+             the puzzles with too few timings for the t-test as
+             'insufficient', the geometric mean 'ratio' of current to
+             baseline medians and the solver 'settings' that differ
+             between the runs
+
+    """
+    regressions = []
+    work = []
+    insufficient = []
+    logs = []
+
+    for name, new in sorted(current['puzzles'].items()):
+        old = baseline['puzzles'].get(name)
+        if old is None:
+            continue
+
+        ratio = new['median'] / old['median']
+        logs.append(math.log(ratio))
+
+        if len(old['times']) < 2 or len(new['times']) < 2:
+            insufficient.append(name)
+        else:
+            p = welch(old['times'], new['times'])
+            if p < alpha and ratio > 1 + threshold:
+                regressions.append({'puzzle': name, 'ratio': ratio, 'p': p})
+
+        for key in ('backtracks', 'recursive_calls'):
+            if (new[key] or 0) > (old[key] or 0):
+                work.append({
+                    'puzzle': name,
+                    'counter': key,
+                    'baseline': old[key],
+                    'current': new[key]
+                })
+
+    settings = [
+        {
+            'setting': setting,
+            'baseline': baseline['meta'].get(setting),
+            'current': current['meta'].get(setting)
+        }
+        for setting in ('solver', 'variable_order', 'value_order')
+        if baseline['meta'].get(setting) != current['meta'].get(setting)
+    ]
+
+    return {
+        'regressions': regressions,
+        'work': work,
+        'insufficient': insufficient,
+        'ratio': math.exp(statistics.mean(logs)) if logs else None,
+        'settings': settings,
+    }
+
+
+def main():
+    """
+    Command line interface for the benchmark suite
+
+      generate: write a seeded puzzle corpus
+      run: benchmark a solver over a corpus and write the results as JSON
+      compare: compare results against a stored baseline; exits with
+               status 1 when regressions are found
+
+    Returns: None
+
+    """
+    from ordering import VALUE_ORDERINGS, VARIABLE_ORDERINGS
+    from puzzle import BUDGETED_SOLVERS, SOLVERS
+
+    parser = argparse.ArgumentParser(description='kenken benchmark suite')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('generate', help='write a puzzle corpus')
+    command.add_argument('-o', '--output', default='./puzzles')
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--count', type=int, default=5,
+                         help='puzzles per width and tier')
+    command.add_argument('--widths', type=int, nargs='+', default=WIDTHS)
+    command.add_argument('--tiers', nargs='+', choices=sorted(TIERS),
+                         default=sorted(TIERS))
+
+    command = commands.add_parser('run', help='benchmark a puzzle corpus')
+    command.add_argument('-c', '--corpus', default='./puzzles')
+    command.add_argument('-o', '--output', default='bench.json')
+    command.add_argument('--solver', choices=sorted(SOLVERS),
+                         default='backtrack')
+    command.add_argument('--warmup', type=int, default=1)
+    command.add_argument('--repeat', type=int, default=5)
+    command.add_argument('--variable-order',
+                         choices=sorted(VARIABLE_ORDERINGS),
+                         help='search variable ordering, such as domwdeg')
+    command.add_argument('--value-order', choices=sorted(VALUE_ORDERINGS),
+                         help='search value ordering, such as support')
+
+    command = commands.add_parser('compare', help='compare to a baseline')
+    command.add_argument('baseline')
+    command.add_argument('current')
+    command.add_argument('--alpha', type=float, default=0.01)
+    command.add_argument('--threshold', type=float, default=0.05)
+
+    args = parser.parse_args()
+
+    if args.command == 'run' and args.solver not in BUDGETED_SOLVERS and \
+            (args.variable_order or args.value_order):
+        parser.error('--variable-order and --value-order need one of the '
+                     '{0} solvers'.format(', '.join(sorted(BUDGETED_SOLVERS))))
+
+    if args.command == 'generate':
+        filenames = generate_corpus(args.output, args.seed, args.widths,
+                                    args.tiers, args.count)
+        print('wrote {0} puzzles to {1}'.format(len(filenames), args.output))
+
+    elif args.command == 'run':
+        filenames = sorted(
+            os.path.join(args.corpus, name)
+            for name in os.listdir(args.corpus) if name.endswith('.kk')
+        )
+        results = run_benchmark(filenames, args.solver, args.warmup,
+                                args.repeat,
+                                variable_order=args.variable_order,
+                                value_order=args.value_order)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('wrote {0}'.format(args.output))
+
+    elif args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+
+        report = compare(baseline, current, args.alpha, args.threshold)
+
+        for change in report['settings']:
+            print('SETTING {setting}: {baseline} -> {current}'
+                  .format(**change))
+        for regression in report['regressions']:
+            print('REGRESSION {puzzle}: {ratio:.3f}x slower (p={p:.2g})'
+                  .format(**regression))
+        for increase in report['work']:
+            print('MORE WORK {puzzle}: {counter} {baseline} -> {current}'
+                  .format(**increase))
+        for name in report['insufficient']:
+            print('INSUFFICIENT SAMPLES {0}: need at least two timings '
+                  'for the t-test'.format(name))
+        if report['ratio'] is not None:
+            print('geometric mean time ratio: {0:.3f}'.format(report['ratio']))
+
+        if report['regressions']:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
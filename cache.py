@@ -0,0 +1,288 @@
+import hashlib
+import sqlite3
+import time
+
+from collections import OrderedDict
+from functools import lru_cache
+
+# seconds a connection waits for another process's write lock on the
+# database before failing with "database is locked"
+BUSY_TIMEOUT = 30.0
+
+SYMMETRIES = (
+    lambda row, col, n: (row, col),
+    lambda row, col, n: (col, n - row),
+    lambda row, col, n: (n - row, n - col),
+    lambda row, col, n: (n - col, row),
+    lambda row, col, n: (col, row),
+    lambda row, col, n: (row, n - col),
+    lambda row, col, n: (n - row, col),
+    lambda row, col, n: (n - col, n - row),
+)
+
+
+@lru_cache(maxsize=None)
+def permutations(width):
+    """
+    Returns: list of the cell index permutations of a grid, one for each of
+             SYMMETRIES, where cell (row, col) has index row * width + col
+
+    """
+    n = width - 1
+    return [
+        [
+            row * width + col
+            for row, col in (
+                symmetry(i // width, i % width, n) for i in range(width * width)
+            )
+        ]
+        for symmetry in SYMMETRIES
+    ]
+
+
+def canonical(puzzle):
+    """
+    Computes the canonical form of a puzzle's cages under the 8 symmetries
+    of the square grid (rotations, reflections and transposes)
+
+    Every operation is symmetric in its cells, so each symmetry of a
+    puzzle maps its solutions to the solutions of the transformed puzzle.
+    The canonical form is the smallest of the 8 transformed cage lists.
+
+    Args:
+        puzzle (Puzzle): the puzzle
+
+    Returns: tuple of the canonical form's hash and the cell index
+             permutation mapping the puzzle onto it
+
+    """
+    from puzzle import ValueConstraint
+
+    width = puzzle.width
+    cages = [
+        (constraint.type, constraint.value,
+         constraint.indices)
+        for constraint in puzzle.constraints
+        if isinstance(constraint, ValueConstraint)
+    ]
+
+    forms = []
+    for permutation in permutations(width):
+        form = sorted(
+            (op, value, sorted([permutation[i] for i in cells]))
+            for op, value, cells in cages
+        )
+        forms.append((form, permutation))
+
+    form, permutation = min(forms, key=lambda pair: pair[0])
+    key = hashlib.sha1(repr((width, form)).encode()).hexdigest()
+    return key, permutation
+
+
+class SolutionCache:
+    """
+    Caches puzzle solutions by the symmetry canonical form of the puzzle
+
+    Solutions are stored in the canonical orientation, so a puzzle hits
+    the cache when any rotation, reflection or transpose of it was solved
+    before. Recently used solutions are kept in an in-memory LRU; with a
+    `path`, solutions are also persisted to a sqlite database, where the
+    least recently used ones are evicted beyond `max_entries`.
+
+    Several processes may share one database: every write runs in its own
+    transaction, which counts the stored solutions itself, and hits from
+    memory also refresh the solution's last use on disk.
+
+    Args:
+        path (str): optional sqlite database filename
+        capacity (int): number of solutions kept in memory
+        max_entries (int): number of solutions kept on disk
+
+    """
+
+    def __init__(self, path=None, capacity=1024, max_entries=100000):
+        self.capacity = capacity
+        self.max_entries = max_entries
+        self.memory = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+        self.db = None
+        if path is not None:
+            self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT,
+                                      isolation_level=None)
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS solutions '
+                '(key TEXT PRIMARY KEY, solution BLOB, used INTEGER)'
+            )
+            self.db.execute(
+                'CREATE INDEX IF NOT EXISTS solutions_used ON solutions (used)'
+            )
+
+    def remember(self, key, solution):
+        """
+        Adds a solution to the in-memory LRU, evicting the least recently
+        used one when full
+
+        Returns: None
+
+        """
+        self.memory[key] = solution
+        self.memory.move_to_end(key)
+        if len(self.memory) > self.capacity:
+            self.memory.popitem(last=False)
+
+    def lookup(self, key):
+        """
+        Args:
+            key (str): canonical puzzle hash
+
+        Returns: bytes the canonical solution, or None
+
+        """
+        solution = self.memory.get(key)
+        if solution is not None:
+            self.memory.move_to_end(key)
+            if self.db is not None:
+                self.touch(key)
+            return solution
+
+        if self.db is None:
+            return None
+
+        row = self.db.execute(
+            'SELECT solution FROM solutions WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        solution = row[0]
+        self.touch(key)
+        self.remember(key, solution)
+        return solution
+
+    def touch(self, key):
+        """
+        Marks a stored solution as just used, for the disk LRU
+
+        Returns: None
+
+        """
+        self.db.execute(
+            'UPDATE solutions SET used = ? WHERE key = ?',
+            (time.time_ns(), key)
+        )
+
+    def store(self, key, solution):
+        """
+        Adds a canonical solution to the cache, persisting it when the
+        cache has a database
+
+        Args:
+            key (str): canonical puzzle hash
+            solution (bytes): canonical solution
+
+        Returns: None
+
+        """
+        self.remember(key, solution)
+
+        if self.db is None:
+            return
+
+        # the write lock is taken up front, so that the count stays exact
+        # while other processes write to the same database
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            self.db.execute(
+                'INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)',
+                (key, solution, time.time_ns())
+            )
+
+            entries = self.db.execute(
+                'SELECT COUNT(*) FROM solutions'
+            ).fetchone()[0]
+            excess = entries - self.max_entries
+            if excess > 0:
+                self.db.execute(
+                    'DELETE FROM solutions WHERE key IN '
+                    '(SELECT key FROM solutions ORDER BY used LIMIT ?)',
+                    (excess,)
+                )
+                self.stats['evictions'] += excess
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        self.db.execute('COMMIT')
+
+    def get(self, puzzle):
+        """
+        Fills in a puzzle from a cached solution
+
+        Args:
+            puzzle (Puzzle): an unsolved puzzle
+
+        Returns: bool whether or not the solution was cached
+
+        """
+        key, permutation = canonical(puzzle)
+        solution = self.lookup(key)
+
+        if solution is None:
+            self.stats['misses'] += 1
+            return False
+
+        self.stats['hits'] += 1
+        for cell in puzzle.cells:
+            cell.value = solution[permutation[cell.index]]
+
+        return True
+
+    def put(self, puzzle):
+        """
+        Caches the solution of a solved puzzle
+
+        Args:
+            puzzle (Puzzle): a solved puzzle
+
+        Returns: None
+
+        """
+        key, permutation = canonical(puzzle)
+
+        solution = bytearray(len(puzzle.values))
+        for index, value in enumerate(puzzle.values):
+            solution[permutation[index]] = value
+
+        self.store(key, bytes(solution))
+
+    def solve(self, puzzle, solve):
+        """
+        Solves a puzzle from the cache, falling back to a solver on misses
+        and caching its solution
+
+        Args:
+            puzzle (Puzzle): an unsolved puzzle
+            solve (callable): solver returning (solved, stats)
+
+        Returns: tuple where first position value is whether or not the
+                 puzzle was solved; second is some stats on the algorithm
+                 performance, with 'cached' set on cache hits
+
+        """
+        if self.get(puzzle):
+            return True, {'cached': True}
+
+        solved, stats = solve(puzzle)
+        if solved:
+            self.put(puzzle)
+        return solved, stats
+
+
+@lru_cache(maxsize=None)
+def open_cache(path):
+    """
+    Returns: SolutionCache the cache for a database file, opened once per
+             process
+
+    """
+    return SolutionCache(path)
@@ -0,0 +1,290 @@
+import argparse
+import mmap
+import struct
+
+from parsing import build_puzzle, dump_compact, iter_puzzles, parse_file
+
+MAGIC = b'KKCORPUS'
+VERSION = 1
+
+# magic, version, number of puzzles, offset of the index
+HEADER = struct.Struct('<8sIIQ')
+
+# puzzle width, number of cages
+RECORD = struct.Struct('<BH')
+
+# operation, target value, number of cells; followed by the cell indices
+CAGE = struct.Struct('<BIB')
+
+OPERATIONS = '+-*/$'
+
+
+def encode(width, cages):
+    """
+    Encodes a puzzle as a binary corpus record
+
+    Args:
+        width (int): puzzle size
+        cages (list): (op, value, cell indices) of each cage, where cell
+                      (row, col) has index row * width + col
+
+    Returns: bytes
+
+    """
+    fmt = [RECORD.format]
+    args = [width, len(cages)]
+    for op, value, indices in cages:
+        fmt.append('BIB{0}H'.format(len(indices)))
+        args += (OPERATIONS.index(op), value, len(indices))
+        args += indices
+    return struct.pack(''.join(fmt), *args)
+
+
+def decode(buffer, offset=0):
+    """
+    Decodes a binary corpus record
+
+    Args:
+        buffer (bytes): buffer holding the record
+        offset (int): position of the record in the buffer
+
+    Returns: tuple of the puzzle width and its (op, value, cell indices)
+             cages
+
+    """
+    width, count = RECORD.unpack_from(buffer, offset)
+    offset += RECORD.size
+
+    cages = []
+    for _ in range(count):
+        op, value, size = CAGE.unpack_from(buffer, offset)
+        offset += CAGE.size
+        indices = struct.unpack_from('<{0}H'.format(size), buffer, offset)
+        offset += 2 * size
+        cages.append((OPERATIONS[op], value, indices))
+
+    return width, cages
+
+
+def puzzle_cages(puzzle):
+    """
+    Returns: list of (op, value, cell indices) of each cage of a `Puzzle`
+
+    """
+    from puzzle import ValueConstraint
+
+    return [
+        (constraint.type, constraint.value, sorted(constraint.indices))
+        for constraint in puzzle.constraints
+        if isinstance(constraint, ValueConstraint)
+    ]
+
+
+def to_puzzle(width, cages):
+    """
+    Builds a `Puzzle` object from a decoded record
+
+    Returns: `Puzzle`
+
+    """
+    return build_puzzle(width, [
+        {
+            'op': op,
+            'value': value,
+            'cells': [divmod(index, width) for index in indices]
+        }
+        for op, value, indices in cages
+    ])
+
+
+class CorpusWriter:
+    """
+    Writes puzzles to a binary corpus file
+
+    The file starts with a fixed size header, followed by the puzzle
+    records and an index of their offsets; the header, which records the
+    number of puzzles and the position of the index, is written when the
+    writer is closed
+
+    Args:
+        filename (str): output filename
+
+    """
+
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+        self.file.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+        self.offsets = []
+
+    def write(self, puzzle):
+        """
+        Appends a puzzle to the corpus
+
+        Args:
+            puzzle (Puzzle): the puzzle to write
+
+        Returns: int the puzzle's index in the corpus
+
+        """
+        return self.write_cages(puzzle.width, puzzle_cages(puzzle))
+
+    def write_cages(self, width, cages):
+        """
+        Appends a puzzle given as its width and cages to the corpus
+
+        Args:
+            width (int): puzzle size
+            cages (list): (op, value, cell indices) of each cage
+
+        Returns: int the puzzle's index in the corpus
+
+        """
+        self.offsets.append(self.file.tell())
+        self.file.write(encode(width, cages))
+        return len(self.offsets) - 1
+
+    def close(self):
+        """
+        Writes the index and the header, and closes the file
+
+        Returns: None
+
+        """
+        index = self.file.tell()
+        self.offsets.append(index)
+        self.file.write(struct.pack('<{0}Q'.format(len(self.offsets)),
+                                    *self.offsets))
+
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, len(self.offsets) - 1,
+                                    index))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Corpus:
+    """
+    Reads puzzles from a binary corpus file by index
+
+    The file is memory mapped, so opening a corpus reads only its header,
+    and each puzzle is decoded on demand from its offset in the index
+
+    Args:
+        filename (str): input filename
+
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, count, index = HEADER.unpack_from(self.buffer)
+        if magic != MAGIC or version != VERSION:
+            self.buffer.close()
+            raise ValueError('{0} is not a version {1} puzzle corpus'.format(
+                filename, VERSION))
+
+        self.count = count
+        self.index = index
+
+    def __len__(self):
+        return self.count
+
+    def offset(self, i):
+        """
+        Returns: int the file offset of the `i`-th puzzle's record
+
+        """
+        if not 0 <= i < self.count:
+            raise IndexError('corpus index out of range')
+        return struct.unpack_from('<Q', self.buffer, self.index + 8 * i)[0]
+
+    def cages(self, i):
+        """
+        Decodes the `i`-th puzzle without building a `Puzzle` object
+
+        Returns: tuple of the puzzle width and its (op, value, cell
+                 indices) cages
+
+        """
+        return decode(self.buffer, self.offset(i))
+
+    def __getitem__(self, i):
+        """
+        Returns: `Puzzle` the `i`-th puzzle
+
+        """
+        return to_puzzle(*self.cages(i))
+
+    def __iter__(self):
+        for i in range(self.count):
+            yield self[i]
+
+    def close(self):
+        """
+        Unmaps the corpus file
+
+        Returns: None
+
+        """
+        self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    """
+    Command line interface for binary puzzle corpora
+
+      pack: write .kk files, or files with one puzzle per line, to a corpus
+      dump: print corpus puzzles in the compact format
+
+    Returns: None
+
+    """
+    parser = argparse.ArgumentParser(description='kenken puzzle corpora')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    command = commands.add_parser('pack', help='write a corpus')
+    command.add_argument('output')
+    command.add_argument('inputs', nargs='+')
+    command.add_argument('--lines', action='store_true',
+                         help='inputs hold one puzzle per line')
+
+    command = commands.add_parser('dump', help='print corpus puzzles')
+    command.add_argument('corpus')
+    command.add_argument('indices', type=int, nargs='*')
+
+    args = parser.parse_args()
+
+    if args.command == 'pack':
+        with CorpusWriter(args.output) as writer:
+            for filename in args.inputs:
+                if not args.lines:
+                    writer.write(parse_file(filename))
+                    continue
+
+                with open(filename) as f:
+                    for puzzle in iter_puzzles(f):
+                        writer.write(puzzle)
+
+            print('wrote {0} puzzles to {1}'.format(len(writer.offsets),
+                                                    args.output))
+
+    elif args.command == 'dump':
+        with Corpus(args.corpus) as corpus:
+            for i in args.indices or range(len(corpus)):
+                print(dump_compact(corpus[i]))
+
+
+if __name__ == '__main__':
+    main()
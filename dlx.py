@@ -0,0 +1,284 @@
+from tables import build_tables
+from utils import with_timing
+
+
+class DancingLinks:
+    """
+    Models a sparse exact cover matrix with Knuth's dancing links
+
+    Nodes are integer indices into flat link arrays. Node 0 is the root
+    header, nodes 1..columns are the column headers, and every 1 in the
+    matrix is a further node linked into its row and its column.
+
+    See https://en.wikipedia.org/wiki/Dancing_Links for more information
+    on this data structure
+
+    Args:
+        columns (int): number of columns in the matrix
+
+    """
+
+    def __init__(self, columns):
+        headers = range(columns + 1)
+        self.left = [i - 1 for i in headers]
+        self.right = [i + 1 for i in headers]
+        self.up = list(headers)
+        self.down = list(headers)
+        self.column = list(headers)
+        self.size = [0] * (columns + 1)
+        self.rows = [None] * (columns + 1)
+
+        self.left[0] = columns
+        self.right[columns] = 0
+
+    def add_row(self, row, columns):
+        """
+        Appends a row to the matrix
+
+        Args:
+            row (object): identifier returned for this row in solutions
+            columns (iter): the 1-based column indices covered by the row
+
+        Returns: None
+
+        """
+        first = None
+        for column in columns:
+            node = len(self.column)
+
+            self.column.append(column)
+            self.rows.append(row)
+            self.up.append(self.up[column])
+            self.down.append(column)
+            self.down[self.up[column]] = node
+            self.up[column] = node
+            self.size[column] += 1
+
+            if first is None:
+                first = node
+                self.left.append(node)
+                self.right.append(node)
+            else:
+                self.left.append(self.left[first])
+                self.right.append(first)
+                self.right[self.left[first]] = node
+                self.left[first] = node
+
+    def cover(self, column):
+        """
+        Removes a column, and every row that covers it, from the matrix
+
+        Args:
+            column (int): column header node
+
+        Returns: None
+
+        """
+        left, right, up, down = self.left, self.right, self.up, self.down
+        size, columns = self.size, self.column
+
+        right[left[column]] = right[column]
+        left[right[column]] = left[column]
+
+        i = down[column]
+        while i != column:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                size[columns[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def uncover(self, column):
+        """
+        Restores a column removed by `cover`
+
+        Args:
+            column (int): column header node
+
+        Returns: None
+
+        """
+        left, right, up, down = self.left, self.right, self.up, self.down
+        size, columns = self.size, self.column
+
+        i = up[column]
+        while i != column:
+            j = left[i]
+            while j != i:
+                size[columns[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+
+        right[left[column]] = column
+        left[right[column]] = column
+
+    def select(self, node):
+        """
+        Covers every other column of the row containing `node`
+
+        Args:
+            node (int): a node of the selected row
+
+        Returns: None
+
+        """
+        j = self.right[node]
+        while j != node:
+            self.cover(self.column[j])
+            j = self.right[j]
+
+    def deselect(self, node):
+        """
+        Reverts `select` for the row containing `node`
+
+        Args:
+            node (int): a node of the deselected row
+
+        Returns: None
+
+        """
+        j = self.left[node]
+        while j != node:
+            self.uncover(self.column[j])
+            j = self.left[j]
+
+    def search(self, stats):
+        """
+        Runs Knuth's Algorithm X over the matrix, always branching on the
+        column with the fewest remaining rows
+
+        The search keeps an explicit stack of the selected row nodes, so
+        matrix size is not bounded by the recursion limit
+
+        Args:
+            stats (dict): 'recursive_calls' is incremented for every row
+                          selected and 'backtracks' for every column whose
+                          rows are exhausted
+
+        Returns: iter lists of row identifiers, one list per exact cover
+
+        """
+        right, down, size = self.right, self.down, self.size
+        stack = []
+        descend = True
+
+        while True:
+            if descend:
+                if right[0] == 0:
+                    yield [self.rows[node] for node in stack]
+                    descend = False
+                else:
+                    column, best = right[0], size[right[0]]
+                    j = right[column]
+                    while j != 0 and best > 1:
+                        if size[j] < best:
+                            column, best = j, size[j]
+                        j = right[j]
+
+                    self.cover(column)
+                    node = down[column]
+                    if node != column:
+                        self.select(node)
+                        stack.append(node)
+                        stats['recursive_calls'] += 1
+                        continue
+
+                    self.uncover(column)
+                    stats['backtracks'] += 1
+                    descend = False
+
+            if not stack:
+                return
+
+            node = stack.pop()
+            self.deselect(node)
+            column = self.column[node]
+            node = down[node]
+
+            if node != column:
+                self.select(node)
+                stack.append(node)
+                stats['recursive_calls'] += 1
+                descend = True
+            else:
+                self.uncover(column)
+                stats['backtracks'] += 1
+
+
+def exact_cover(puzzle):
+    """
+    Builds the exact cover matrix for a puzzle
+
+    Columns are one per cage, one per cell, one per (row, value) and one
+    per (column, value). Each matrix row fills one cage with one of the
+    tuples from its combination table, covering the cage, its cells and
+    the row/column values of those cells.
+
+    Args:
+        puzzle (Puzzle): the puzzle to encode
+
+    Returns: `DancingLinks` whose row identifiers are (constraint, tuple)
+
+    """
+    width = puzzle.width
+    tables = build_tables(puzzle)
+
+    cage_columns = {constraint: i + 1 for i, constraint in enumerate(tables)}
+    cell_offset = len(tables) + 1
+    row_offset = cell_offset + width * width
+    col_offset = row_offset + width * width
+
+    matrix = DancingLinks(col_offset + width * width - 1)
+
+    for constraint, table in tables.items():
+        for values in table.tuples:
+            columns = [cage_columns[constraint]]
+            for cell, value in zip(constraint.cells, values):
+                columns.append(cell_offset + cell.row * width + cell.col)
+                columns.append(row_offset + cell.row * width + value - 1)
+                columns.append(col_offset + cell.col * width + value - 1)
+            matrix.add_row((constraint, values), columns)
+
+    return matrix
+
+
+@with_timing
+def dlx_solve(puzzle):
+    """
+    Solves a kenken puzzle as an exact cover problem with dancing links
+
+    A kenken puzzle is a latin square whose cages are each filled with
+    one of their allowed tuples, which is exactly an exact cover of the
+    cage, cell, row-value and column-value columns
+
+    See https://en.wikipedia.org/wiki/Exact_cover for more information
+    on this reduction
+
+    Args:
+        puzzle `Puzzle`: object to solve
+
+    Returns: tuple where first position value is whether or not the puzzle
+             was solved; second is some stats on the algorithm performance
+
+    """
+
+    stats = {
+        'backtracks': 0,
+        'recursive_calls': 0
+    }
+
+    matrix = exact_cover(puzzle)
+    solution = next(matrix.search(stats), None)
+
+    if solution is None:
+        return False, stats
+
+    for constraint, values in solution:
+        for cell, value in zip(constraint.cells, values):
+            cell.value = value
+
+    return puzzle.solved, stats
@@ -0,0 +1,356 @@
+import argparse
+import multiprocessing
+import random
+import sys
+
+from functools import partial
+from parsing import parse_string
+from solver import count_solutions
+from utils import product
+
+NEIGHBOURS = ((0, 1), (1, 0), (0, -1), (-1, 0))
+
+SIZES = {1: 1, 2: 4, 3: 3, 4: 2}
+
+OPERATIONS = {'+': 3, '*': 2, '-': 2, '/': 1}
+
+
+def latin_square(width, rng):
+    """
+    Builds a random latin square by shuffling the rows, columns and
+    symbols of the cyclic square
+
+    Args:
+        width (int): square size
+        rng (random.Random): random number generator
+
+    Returns: list of rows, each a list of values 1..width
+
+    """
+    symbols = list(range(1, width + 1))
+    rows = list(range(width))
+    cols = list(range(width))
+    rng.shuffle(symbols)
+    rng.shuffle(rows)
+    rng.shuffle(cols)
+
+    return [
+        [symbols[(row + col) % width] for col in cols]
+        for row in rows
+    ]
+
+
+def partition(width, rng, sizes):
+    """
+    Partitions a grid into random connected cages
+
+    Cages are grown from the first free cell in reading order by adding
+    random free orthogonal neighbours, until the drawn size is reached or
+    the cage cannot grow further
+
+    Args:
+        width (int): grid size
+        rng (random.Random): random number generator
+        sizes (dict): relative weight of each cage size
+
+    Returns: list of cages, each a list of (row, col) tuples
+
+    """
+    population, weights = zip(*sorted(sizes.items()))
+    free = {(row, col) for row in range(width) for col in range(width)}
+    order = sorted(free)
+    cages = []
+
+    for start in order:
+        if start not in free:
+            continue
+
+        free.discard(start)
+        cage = [start]
+        size = rng.choices(population, weights)[0]
+
+        while len(cage) < size:
+            frontier = sorted({
+                (row + dr, col + dc)
+                for row, col in cage
+                for dr, dc in NEIGHBOURS
+                if (row + dr, col + dc) in free
+            })
+            if not frontier:
+                break
+
+            cell = rng.choice(frontier)
+            free.discard(cell)
+            cage.append(cell)
+
+        cages.append(cage)
+
+    return cages
+
+
+def operations(values, ops):
+    """
+    Returns the operations from a distribution that apply to the given
+    cage values: subtraction and division need exactly two values, and
+    division needs one to divide the other
+
+    Args:
+        values (list): the cage's solution values
+        ops (dict): relative weight of each operation type
+
+    Returns: dict the applicable operations and their weights
+
+    """
+    from puzzle import ValueConstraint
+
+    applicable = {}
+    for op, weight in ops.items():
+        if op in (ValueConstraint.TYPE_SUB, ValueConstraint.TYPE_DIV):
+            if len(values) != 2:
+                continue
+            if op == ValueConstraint.TYPE_DIV and max(values) % min(values):
+                continue
+        applicable[op] = weight
+    return applicable
+
+
+def evaluate(op, values):
+    """
+    Returns: int the target value of a cage with the given operation and
+             solution values
+
+    """
+    from puzzle import ValueConstraint
+
+    if op == ValueConstraint.TYPE_ADD:
+        return sum(values)
+    if op == ValueConstraint.TYPE_MUL:
+        return product(values)
+    if op == ValueConstraint.TYPE_SUB:
+        return max(values) - min(values)
+    if op == ValueConstraint.TYPE_DIV:
+        return max(values) // min(values)
+    return values[0]
+
+
+def make_cage(cells, grid, rng, ops=None):
+    """
+    Picks an operation for a cage and computes its target value from the
+    solution grid
+
+    Single cells are constants. Without an operation distribution, two
+    cell cages are divisions when the values divide evenly (half of the
+    time) or subtractions, and larger cages are additions or
+    multiplications; otherwise the operation is drawn from the applicable
+    operations of `ops`
+
+    Args:
+        cells (list): (row, col) tuples
+        grid (list): solution rows
+        rng (random.Random): random number generator
+        ops (dict): optional relative weight of each operation type
+
+    Returns: dict a cage in the format `parse_string` accepts
+
+    """
+    from puzzle import ValueConstraint
+
+    values = [grid[row][col] for row, col in cells]
+
+    if len(cells) > 1 and ops is not None:
+        applicable = operations(values, ops)
+        if applicable:
+            population, weights = zip(*sorted(applicable.items()))
+            op = rng.choices(population, weights)[0]
+            return {'value': evaluate(op, values), 'op': op,
+                    'cells': sorted(cells)}
+
+    if len(cells) == 1:
+        op, value = ValueConstraint.TYPE_CON, values[0]
+    elif len(cells) == 2:
+        high, low = max(values), min(values)
+        if high % low == 0 and rng.random() < 0.5:
+            op, value = ValueConstraint.TYPE_DIV, high // low
+        else:
+            op, value = ValueConstraint.TYPE_SUB, high - low
+    elif rng.random() < 0.5:
+        op, value = ValueConstraint.TYPE_ADD, sum(values)
+    else:
+        op, value = ValueConstraint.TYPE_MUL, product(values)
+
+    return {'value': value, 'op': op, 'cells': sorted(cells)}
+
+
+def generate(width, rng, sizes):
+    """
+    Generates a random puzzle specification with at least one solution
+
+    Args:
+        width (int): puzzle size
+        rng (random.Random): random number generator
+        sizes (dict): relative weight of each cage size
+
+    Returns: dict in the format `parse_string` accepts
+
+    """
+    grid = latin_square(width, rng)
+    cages = [make_cage(cells, grid, rng) for cells in partition(width, rng, sizes)]
+    return {'width': width, 'cages': cages}
+
+
+def unique(spec):
+    """
+    Returns whether a puzzle specification has exactly one solution
+
+    The search stops as soon as a second solution is found
+
+    Args:
+        spec (dict): puzzle in the format `parse_string` accepts
+
+    Returns: bool
+
+    """
+    return count_solutions(parse_string(repr(spec)), limit=2) == 1
+
+
+def generate_unique(width, rng, sizes=SIZES, ops=OPERATIONS):
+    """
+    Generates a random puzzle specification with exactly one solution
+
+    Generation starts from the solution grid with every cell a constant
+    cage, which is trivially unique. The cages of a random partition are
+    then added one at a time, each replacing the constants of its cells,
+    and uniqueness is re-checked after every addition; since the other
+    cells are still mostly constants these checks are cheap. A cage whose
+    operations all break uniqueness is split back into smaller cages.
+
+    Args:
+        width (int): puzzle size
+        rng (random.Random): random number generator
+        sizes (dict): relative weight of each cage size
+        ops (dict): relative weight of each operation type
+
+    Returns: dict in the format `parse_string` accepts
+
+    """
+    grid = latin_square(width, rng)
+    cages = {
+        (row, col): make_cage([(row, col)], grid, rng)
+        for row in range(width)
+        for col in range(width)
+    }
+
+    def spec():
+        """
+        Returns: dict the puzzle with the current cages
+
+        """
+        distinct = {id(cage): cage for cage in cages.values()}
+        return {'width': width, 'cages': list(distinct.values())}
+
+    pending = [cells for cells in partition(width, rng, sizes) if len(cells) > 1]
+    while pending:
+        cells = pending.pop()
+        previous = [cages[cell] for cell in cells]
+
+        applicable = operations([grid[row][col] for row, col in cells], ops)
+        # try the operations in a random order weighted by the distribution
+        order = sorted(applicable, key=lambda op: rng.random() / applicable[op])
+
+        for op in order:
+            cage = make_cage(cells, grid, rng, {op: 1})
+            for cell in cells:
+                cages[cell] = cage
+            if unique(spec()):
+                break
+        else:
+            for cell, cage in zip(cells, previous):
+                cages[cell] = cage
+            if len(cells) > 2:
+                pending.append(cells[:len(cells) // 2])
+                pending.append(cells[len(cells) // 2:])
+
+    return spec()
+
+
+def generate_many(count, width, seed=0, sizes=SIZES, ops=OPERATIONS, jobs=1):
+    """
+    Generates unique puzzle specifications, optionally with a pool of
+    worker processes
+
+    Every puzzle has its own generator seeded by (seed, width, index), so
+    the output does not depend on the number of jobs
+
+    Args:
+        count (int): number of puzzles
+        width (int): puzzle size
+        seed (int): generation seed
+        sizes (dict): relative weight of each cage size
+        ops (dict): relative weight of each operation type
+        jobs (int): number of worker processes; 1 generates in this process
+
+    Returns: iter of dicts in the format `parse_string` accepts
+
+    """
+    worker = partial(generate_indexed, width, seed, sizes, ops)
+
+    if jobs <= 1:
+        yield from map(worker, range(count))
+        return
+
+    with multiprocessing.Pool(jobs) as pool:
+        yield from pool.imap(worker, range(count), chunksize=4)
+
+
+def generate_indexed(width, seed, sizes, ops, index):
+    """
+    Generates the `index`-th unique puzzle of a seeded batch
+
+    Returns: dict in the format `parse_string` accepts
+
+    """
+    return generate_unique(width, seeded(seed, width, index), sizes, ops)
+
+
+def seeded(*parts):
+    """
+    Returns a random number generator seeded from the given parts, so that
+    every puzzle of a corpus can be regenerated on its own
+
+    Args:
+        parts (iter): values identifying the puzzle
+
+    Returns: random.Random
+
+    """
+    return random.Random('-'.join(map(str, parts)))
+
+
+def main():
+    """
+    Command line interface for the puzzle generator
+
+    Writes one unique puzzle per line to stdout, in the .kk format that
+    `parse_string` accepts
+
+    Returns: None
+
+    """
+    parser = argparse.ArgumentParser(description='kenken puzzle generator')
+    parser.add_argument('-w', '--width', type=int, default=6)
+    parser.add_argument('-n', '--count', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--max-cage', type=int, default=max(SIZES),
+                        help='largest cage size')
+
+    args = parser.parse_args()
+    sizes = {size: w for size, w in SIZES.items() if size <= args.max_cage}
+
+    for spec in generate_many(args.count, args.width, args.seed, sizes,
+                              OPERATIONS, args.jobs):
+        sys.stdout.write(repr(spec) + '\n')
+
+
+if __name__ == '__main__':
+    main()
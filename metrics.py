@@ -0,0 +1,368 @@
+import json
+import os
+import time
+
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# default histogram bucket upper bounds
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_registry = None
+
+
+def key(name, **labels):
+    """
+    Builds a metric key from a name and labels, in the Prometheus text
+    format, such as 'reduce{constraint="add"}'
+
+    Keys are built once, outside of hot loops, and then used as plain
+    dictionary keys
+
+    Args:
+        name (str): metric name
+        labels (dict): label values
+
+    Returns: str
+
+    """
+    if not labels:
+        return name
+    return '{0}{{{1}}}'.format(name, ','.join(
+        '{0}="{1}"'.format(label, value)
+        for label, value in sorted(labels.items())
+    ))
+
+
+class Histogram:
+    """
+    Counts observed values in fixed buckets
+
+    Args:
+        bounds (tuple): sorted bucket upper bounds; values above the last
+                        bound fall in an extra overflow bucket
+
+    """
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Adds a value to its bucket
+
+        Returns: None
+
+        """
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """
+        Returns: dict of the bucket 'bounds' and 'counts', and the 'sum'
+                 and 'count' of the observed values
+
+        """
+        return {
+            'bounds': list(self.bounds),
+            'counts': list(self.counts),
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+class Metrics:
+    """
+    Registry of counters, timers and histograms
+
+    Counters add up integer amounts, timers add up durations in seconds
+    along with their count and maximum, and histograms bucket observed
+    values. Metrics are created on first use and identified by their key
+    (see `key`). Snapshots are written to every sink on `flush`.
+
+    Args:
+        sinks (iter): objects with a `write(snapshot)` method, such as
+                      `MemorySink`, `JsonSink` or `PrometheusSink`
+
+    """
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self.counters = {}
+        self.timers = {}
+        self.histograms = {}
+
+    def incr(self, name, amount=1):
+        """
+        Adds to a counter
+
+        Returns: None
+
+        """
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def timing(self, name, seconds):
+        """
+        Records a duration on a timer
+
+        Returns: None
+
+        """
+        timer = self.timers.get(name)
+        if timer is None:
+            self.timers[name] = [1, seconds, seconds]
+            return
+        timer[0] += 1
+        timer[1] += seconds
+        if seconds > timer[2]:
+            timer[2] = seconds
+
+    @contextmanager
+    def timer(self, name):
+        """
+        Times the body of a with statement
+
+        Returns: None
+
+        """
+        ts = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(name, time.perf_counter() - ts)
+
+    def histogram(self, name, bounds=BUCKETS):
+        """
+        Returns: Histogram the histogram for a key, created with `bounds`
+                 on first use; hot loops can keep it and call its
+                 `observe` directly
+
+        """
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(bounds)
+        return histogram
+
+    def observe(self, name, value):
+        """
+        Adds a value to a histogram
+
+        Returns: None
+
+        """
+        self.histogram(name).observe(value)
+
+    def snapshot(self):
+        """
+        Returns: dict of the 'counters', the 'timers' (with their 'count',
+                 'total' and 'max' seconds) and the 'histograms'
+
+        """
+        return {
+            'counters': dict(self.counters),
+            'timers': {
+                name: {'count': count, 'total': total, 'max': longest}
+                for name, (count, total, longest) in self.timers.items()
+            },
+            'histograms': {
+                name: histogram.snapshot()
+                for name, histogram in self.histograms.items()
+            },
+        }
+
+    def flush(self):
+        """
+        Writes a snapshot to every sink
+
+        Returns: dict the snapshot
+
+        """
+        snapshot = self.snapshot()
+        for sink in self.sinks:
+            sink.write(snapshot)
+        return snapshot
+
+    def reset(self):
+        """
+        Clears every metric
+
+        Returns: None
+
+        """
+        self.counters.clear()
+        self.timers.clear()
+        self.histograms.clear()
+
+
+def write_atomic(filename, text):
+    """
+    Replaces a file's contents at once, so that readers never see a
+    partially written file
+
+    Returns: None
+
+    """
+    temporary = '{0}.{1}.tmp'.format(filename, os.getpid())
+    with open(temporary, 'w') as f:
+        f.write(text)
+    os.replace(temporary, filename)
+
+
+class MemorySink:
+    """
+    Keeps every snapshot in memory, mostly for tests and notebooks
+
+    """
+
+    def __init__(self):
+        self.snapshots = []
+
+    def write(self, snapshot):
+        self.snapshots.append(snapshot)
+
+
+class JsonSink:
+    """
+    Writes the latest snapshot to a JSON file
+
+    Args:
+        filename (str): output filename
+
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def write(self, snapshot):
+        write_atomic(self.filename, json.dumps(snapshot, indent=2) + '\n')
+
+
+class PrometheusSink:
+    """
+    Writes the latest snapshot to a file in the Prometheus text exposition
+    format, as read by the node exporter's textfile collector
+
+    Counters are exported with a '_total' suffix, timers as summaries of
+    seconds with '_seconds_count' and '_seconds_sum' and histograms with
+    cumulative '_bucket' counts
+
+    Args:
+        filename (str): output filename, which should end in '.prom'
+        prefix (str): prefix of every metric name
+
+    """
+
+    def __init__(self, filename, prefix='kenken_'):
+        self.filename = filename
+        self.prefix = prefix
+
+    def name(self, metric, suffix, **extra):
+        """
+        Returns: str the exported sample name of a metric key, with a
+                 suffix added to its name and extra labels to its labels
+
+        """
+        name, _, labels = metric.partition('{')
+        labels = labels.rstrip('}')
+        extra = ','.join(
+            '{0}="{1}"'.format(label, value) for label, value in extra.items()
+        )
+        labels = ','.join(filter(None, (labels, extra)))
+        return '{0}{1}{2}{3}'.format(
+            self.prefix, name, suffix, '{' + labels + '}' if labels else ''
+        )
+
+    def format(self, snapshot):
+        """
+        Returns: str the snapshot in the text exposition format
+
+        """
+        lines = []
+        types = set()
+
+        def declare(metric, suffix, kind):
+            family = self.prefix + metric.partition('{')[0] + suffix
+            if family not in types:
+                types.add(family)
+                lines.append('# TYPE {0} {1}'.format(family, kind))
+
+        for metric, value in sorted(snapshot['counters'].items()):
+            declare(metric, '_total', 'counter')
+            lines.append('{0} {1}'.format(self.name(metric, '_total'), value))
+
+        for metric, timer in sorted(snapshot['timers'].items()):
+            declare(metric, '_seconds', 'summary')
+            lines.append('{0} {1}'.format(
+                self.name(metric, '_seconds_count'), timer['count']))
+            lines.append('{0} {1!r}'.format(
+                self.name(metric, '_seconds_sum'), timer['total']))
+
+        for metric, histogram in sorted(snapshot['histograms'].items()):
+            declare(metric, '', 'histogram')
+            cumulative = 0
+            bounds = histogram['bounds'] + ['+Inf']
+            for bound, count in zip(bounds, histogram['counts']):
+                cumulative += count
+                lines.append('{0} {1}'.format(
+                    self.name(metric, '_bucket', le=bound), cumulative))
+            lines.append('{0} {1}'.format(
+                self.name(metric, '_sum'), histogram['sum']))
+            lines.append('{0} {1}'.format(
+                self.name(metric, '_count'), histogram['count']))
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, snapshot):
+        write_atomic(self.filename, self.format(snapshot))
+
+
+SINKS = {
+    'json': JsonSink,
+    'prometheus': PrometheusSink,
+}
+
+
+def enable(*sinks):
+    """
+    Starts collecting metrics in this process
+
+    Instrumented code looks the registry up once per solve, so metrics
+    cost next to nothing while disabled
+
+    Args:
+        sinks (list): sinks for the registry
+
+    Returns: Metrics the active registry
+
+    """
+    global _registry
+    _registry = Metrics(sinks)
+    return _registry
+
+
+def disable():
+    """
+    Stops collecting metrics, flushing the registry to its sinks
+
+    Returns: Metrics the registry that was active, or None
+
+    """
+    global _registry
+    registry, _registry = _registry, None
+    if registry is not None:
+        registry.flush()
+    return registry
+
+
+def active():
+    """
+    Returns: Metrics the active registry, or None if metrics are disabled
+
+    """
+    return _registry
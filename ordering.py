@@ -0,0 +1,254 @@
+from abc import ABC, abstractmethod
+from tables import build_tables
+from utils import iter_bits, lowest_bit, popcount
+
+
+class VariableOrdering(ABC):
+    """
+    Chooses the cell a backtracking search branches on next
+
+    `start` is called when the search is initialized, before the initial
+    propagation. Orderings that learn from failures set `conflicts`, so
+    that the search tracks the constraint behind each failed assignment
+    and reports it to `failed`. When the search has an `rng`, ties are
+    broken at random.
+
+    """
+
+    conflicts = False
+
+    def start(self, search):
+        """
+        Args:
+            search (Search): the search being initialized
+
+        Returns: None
+
+        """
+        pass
+
+    @abstractmethod
+    def select(self, search):
+        """
+        Args:
+            search (Search): the search
+
+        Returns: Cell the unassigned cell to branch on, or None if every
+                 cell is assigned
+
+        """
+        pass
+
+    def failed(self, constraint):
+        """
+        Notifies the ordering of a failed assignment
+
+        Args:
+            constraint (Constraint): the constraint that failed it, or
+                                     None if it is not known
+
+        Returns: None
+
+        """
+        pass
+
+
+class MinimumRemainingValues(VariableOrdering):
+    """
+    Picks the unassigned cell with the fewest candidates (MRV), first in
+    cell order on ties
+
+    """
+
+    def select(self, search):
+        candidates, rng = search.candidates, search.rng
+        if rng is None:
+            return min(search.puzzle.unassigned,
+                       key=lambda cell: popcount(candidates(cell)),
+                       default=None)
+
+        return min(search.puzzle.unassigned,
+                   key=lambda cell: (popcount(candidates(cell)), rng.random()),
+                   default=None)
+
+
+class DomWdeg(VariableOrdering):
+    """
+    Picks the unassigned cell with the smallest ratio of candidates to
+    weighted degree (dom/wdeg), breaking ties by the most unassigned cells
+    left in the cell's cage
+
+    Every constraint starts with a weight of 1, incremented each time it
+    fails an assignment. A cell's weighted degree sums the weights of its
+    constraints that still have another unassigned cell, so the search is
+    drawn to the parts of the puzzle that keep failing. The weights carry
+    over when the ordering is reused for another search of the puzzle.
+
+    See Boussemart et al., "Boosting systematic search by weighting
+    constraints" (ECAI 2004)
+
+    """
+
+    conflicts = True
+
+    def __init__(self):
+        self.weights = {}
+        self.cages = {}
+
+    def start(self, search):
+        from puzzle import ValueConstraint
+
+        for constraint in search.puzzle.constraints:
+            self.weights.setdefault(constraint, 1)
+        self.cages = {
+            cell: constraint
+            for constraint in search.puzzle.constraints
+            if isinstance(constraint, ValueConstraint)
+            for cell in constraint.cells
+        }
+
+    def failed(self, constraint):
+        if constraint is not None:
+            self.weights[constraint] += 1
+
+    def select(self, search):
+        weights, cages = self.weights, self.cages
+        candidates, rng = search.candidates, search.rng
+
+        best, best_key = None, None
+        for cell in search.puzzle.unassigned:
+            wdeg = 0
+            for constraint in cell.constraints:
+                if constraint.free > 1:
+                    wdeg += weights[constraint]
+
+            size = popcount(candidates(cell))
+            cage = cages.get(cell)
+            key = (size / wdeg if wdeg else size,
+                   -cage.free if cage is not None else 0,
+                   rng.random() if rng is not None else 0)
+
+            if best_key is None or key < best_key:
+                best, best_key = cell, key
+
+        return best
+
+
+class ValueOrdering:
+    """
+    Chooses the order in which a backtracking search tries the candidate
+    values of a cell; the base ordering tries the lowest value first, or
+    a random one when the search has an `rng`
+
+    """
+
+    def start(self, search):
+        """
+        Args:
+            search (Search): the search being initialized
+
+        Returns: None
+
+        """
+        pass
+
+    def choose(self, search, cell, mask):
+        """
+        Args:
+            search (Search): the search
+            cell (Cell): the unassigned cell being branched on
+            mask (int): non-zero bitmask of the values left to try
+
+        Returns: int the value to try next
+
+        """
+        if search.rng is None:
+            return lowest_bit(mask)
+        return search.rng.choice(list(iter_bits(mask)))
+
+
+class LeastConstrainingValue(ValueOrdering):
+    """
+    Tries first the value that is a candidate for the fewest unassigned
+    cells sharing a row, column or cage with the cell, since it rules out
+    the fewest options for them (LCV)
+
+    """
+
+    def __init__(self):
+        self.peers = {}
+
+    def start(self, search):
+        self.peers = {
+            cell: tuple({
+                other
+                for constraint in cell.constraints
+                for other in constraint.cells
+                if other is not cell
+            })
+            for cell in search.puzzle.cells
+        }
+
+    def choose(self, search, cell, mask):
+        if not mask & (mask - 1):
+            return lowest_bit(mask)
+
+        masks = [
+            search.candidates(peer)
+            for peer in self.peers[cell] if peer.value is None
+        ]
+        return min(iter_bits(mask), key=lambda value: (
+            sum(1 for peer in masks if peer >> value & 1),
+            search.rng.random() if search.rng is not None else value
+        ))
+
+
+class TupleSupport(ValueOrdering):
+    """
+    Tries first the value that appears in the most cage tuples compatible
+    with the current domains of the cell's cage, since it leaves the cage
+    the most ways to be completed
+
+    """
+
+    def __init__(self):
+        self.tables = {}
+
+    def start(self, search):
+        tables = search.cage_tables
+        if tables is None:
+            tables = build_tables(search.puzzle)
+
+        self.tables = {
+            cell: table
+            for table in tables.values()
+            for cell in table.constraint.cells
+        }
+
+    def choose(self, search, cell, mask):
+        table = self.tables.get(cell)
+        if table is None or not mask & (mask - 1):
+            return lowest_bit(mask)
+
+        position = table.positions[cell]
+        counts = {}
+        for bits in table.live():
+            bit = bits[position]
+            counts[bit] = counts.get(bit, 0) + 1
+
+        return max(iter_bits(mask), key=lambda value: (
+            counts.get(1 << value, 0),
+            search.rng.random() if search.rng is not None else -value
+        ))
+
+
+VARIABLE_ORDERINGS = {
+    'mrv': MinimumRemainingValues,
+    'domwdeg': DomWdeg,
+}
+
+VALUE_ORDERINGS = {
+    'min': ValueOrdering,
+    'lcv': LeastConstrainingValue,
+    'support': TupleSupport,
+}
@@ -0,0 +1,144 @@
+import multiprocessing
+import os
+
+from functools import partial
+from parsing import dump_string, parse_string
+from solver import Search
+from utils import with_timing
+
+SPLIT_FACTOR = 4
+
+
+def split(search, jobs, max_depth=4):
+    """
+    Splits the top of a search tree into independent subproblems
+
+    The tree is cut one decision level deeper at a time, until there are
+    at least SPLIT_FACTOR subproblems per worker or `max_depth` is reached,
+    so that workers which finish early can keep taking more work
+
+    Args:
+        search (Search): initialized search over the puzzle
+        jobs (int): number of workers
+        max_depth (int): deepest decision level to split at
+
+    Returns: list of subproblems, each a list of (row, col, value)
+             decisions; None if the puzzle was solved while splitting, in
+             which case the puzzle holds the solution
+
+    """
+    subproblems = []
+    for depth in range(1, max_depth + 1):
+        subproblems = []
+        for decided in search.run(depth=depth):
+            if search.puzzle.solved:
+                return None
+            subproblems.append(
+                [(cell.row, cell.col, cell.value) for cell in decided]
+            )
+
+        if len(subproblems) >= SPLIT_FACTOR * jobs:
+            break
+
+    return subproblems
+
+
+def solve_subproblem(text, decisions, options):
+    """
+    Solves a puzzle from a partial assignment, in a worker process
+
+    Args:
+        text (str): the puzzle, as formatted by `dump_string`
+        decisions (list): (row, col, value) assignments to start from
+        options (dict): keyword arguments for `Search`
+
+    Returns: tuple of the solution as (row, col, value) assignments, or
+             None, and the search stats
+
+    """
+    puzzle = parse_string(text)
+    for row, col, value in decisions:
+        puzzle.cells[row * puzzle.width + col].value = value
+
+    search = Search(puzzle, **options)
+    if not search.initialize() or next(search.run(), None) is None:
+        return None, search.stats
+
+    return [(cell.row, cell.col, cell.value) for cell in puzzle.cells], \
+        search.stats
+
+
+@with_timing
+def parallel_solve(puzzle, jobs=None, max_depth=4, **options):
+    """
+    Solves a kenken puzzle by splitting the top of the backtracking search
+    tree into subproblems that are solved by a pool of worker processes
+
+    Subproblems are handed out one at a time from a shared queue, so idle
+    workers take the next one as soon as they finish. As soon as any
+    worker finds a solution, the pool is terminated, cancelling every
+    other worker.
+
+    A `max_nodes` budget covers the whole search: whatever the split left
+    of it is divided evenly between the subproblems. The `cancel` token is
+    only checked between subproblem results in this process, since it
+    cannot be sent to the workers.
+
+    Args:
+        puzzle `Puzzle`: object to solve
+        jobs (int): number of worker processes; defaults to the CPU count
+        max_depth (int): deepest decision level to split at
+        options (dict): keyword arguments for `Search`
+
+    Returns: tuple where first position value is whether or not the puzzle
+             was solved, or None if a search budget aborted the split or
+             some subproblem before a solution was found; second is some
+             stats on the algorithm performance, summed over the split and
+             every subproblem that finished
+
+    """
+    jobs = jobs or os.cpu_count()
+
+    search = Search(puzzle, **options)
+    stats = search.stats
+
+    if not search.initialize():
+        return (None if search.aborted else False), stats
+
+    subproblems = split(search, jobs, max_depth)
+    if subproblems is None:
+        return True, stats
+    if search.aborted:
+        return None, stats
+
+    stats['subproblems'] = len(subproblems)
+
+    # the token cannot be sent to the workers, so the pool is terminated
+    # from here instead; the node budget left is shared between subproblems
+    cancel = options.pop('cancel', None)
+    if options.get('max_nodes') is not None:
+        left = max(options['max_nodes'] - stats['recursive_calls'], 0)
+        options['max_nodes'] = left // len(subproblems)
+    worker = partial(solve_subproblem, dump_string(puzzle), options=options)
+
+    with multiprocessing.Pool(jobs) as pool:
+        for solution, sub_stats in pool.imap_unordered(worker, subproblems):
+            for key, value in sub_stats.items():
+                if key == 'aborted':
+                    stats[key] = value
+                else:
+                    stats[key] = stats.get(key, 0) + value
+
+            if solution is not None:
+                pool.terminate()
+
+                for row, col, value in solution:
+                    puzzle.cells[row * puzzle.width + col].value = value
+                return puzzle.solved, stats
+
+            if cancel is not None and cancel.is_set():
+                pool.terminate()
+                stats['aborted'] = 'cancelled'
+                return None, stats
+
+    return (None if 'aborted' in stats else False), stats
@@ -1,5 +1,11 @@
+import json
+
 from ast import literal_eval
 
+# translates the python literal .kk format to JSON: its keys and operations
+# are plain strings and its cells are tuples
+REPR_TO_JSON = str.maketrans("'()", '"[]')
+
 
 def parse_file(filename):
     """
@@ -39,6 +45,9 @@ def parse_string(s):
         '/' -> DivConstraint,
         '$' -> ConConstraint
 
+    The same dictionary may also be given as JSON, with cells as two
+    element lists, or in the compact format of `parse_compact`.
+
     The exclusive row/column cages will be created automatically
 
     Args:
@@ -46,6 +55,83 @@ def parse_string(s):
 
     Returns: `Puzzle` object
 
+    """
+    s = s.strip()
+    if not s.startswith('{'):
+        return parse_compact(s)
+
+    # JSON decoding is much faster than literal_eval, and the literal
+    # format is valid JSON after swapping its quotes and tuples
+    try:
+        d = json.loads(s.translate(REPR_TO_JSON))
+    except ValueError:
+        d = literal_eval(s)
+
+    puzzle_width = d.get('width')
+    puzzle_cages = d.get('cages')
+
+    # ensure that both the puzzle width and a set of cages are provided
+    if puzzle_width is None or puzzle_cages is None:
+        raise SyntaxError(
+            "Expected 'width' and 'cages'. Got `{0}`".format(d)
+        )
+
+    return build_puzzle(puzzle_width, puzzle_cages)
+
+
+def parse_compact(s):
+    """
+    Parse a puzzle in the compact, single line format to a `Puzzle` object
+
+    The line holds the puzzle width followed by one token per cage: the
+    operation, the target value, a colon, and the comma separated indices
+    (row * width + col) of the cage's cells. For example, the puzzle in
+    `parse_string` is:
+
+        2 /2:0,1 +3:2,3
+
+    Args:
+        s (str): input line to read
+
+    Returns: `Puzzle` object
+
+    """
+    tokens = s.split()
+    if not tokens:
+        raise SyntaxError('Expected a puzzle. Got an empty string')
+
+    width = int(tokens[0])
+    cages = []
+    for token in tokens[1:]:
+        head, _, cells = token.partition(':')
+        if not head or not cells:
+            raise SyntaxError(
+                "Expected '<op><value>:<cells>'. Got `{0}`".format(token)
+            )
+
+        cages.append({
+            'op': head[0],
+            'value': int(head[1:]),
+            'cells': [divmod(int(index), width) for index in cells.split(',')]
+        })
+
+    return build_puzzle(width, cages)
+
+
+def build_puzzle(puzzle_width, puzzle_cages):
+    """
+    Builds a `Puzzle` object from its width and cages
+
+    Cells are created straight into their row * width + col slot of the
+    grid, so that the row/column cages are built by slicing the grid
+
+    Args:
+        puzzle_width (int): puzzle size
+        puzzle_cages (list): dicts with the 'value', 'op' and 'cells' of
+                             each cage
+
+    Returns: `Puzzle` object
+
     """
 
     from puzzle import (
@@ -68,23 +154,12 @@ def parse_string(s):
         ConConstraint.__name__: ConConstraint
     }
 
-    d = literal_eval(s.strip())
-
-    puzzle_width = d.get('width')
-    puzzle_cages = d.get('cages')
-
-    # ensure that both the puzzle width and a set of cages are provided
-    if puzzle_width is None or puzzle_cages is None:
-        raise SyntaxError(
-            "Expected 'width' and 'cages'. Got `{0}`".format(d)
-        )
-
-    puzzle_cells = set()
+    grid = [None] * (puzzle_width * puzzle_width)
     puzzle_constraints = []
 
     for cage in puzzle_cages:
         value = cage.get('value')
-        cells = set(cage.get('cells'))
+        cells = cage.get('cells')
 
         # ensure both 'value' and 'cells' are provided
         if value is None or cells is None:
@@ -92,10 +167,6 @@ def parse_string(s):
                 "Expected 'value' and 'cells'. Got {0}".format(cage)
             )
 
-        # ensure that none of these cells has already been parsed
-        if cells.intersection(puzzle_cells):
-            raise Exception('Some cells exist in another cage {0}'.format(cells))
-
         op = cage.get('op')
 
         # ensure that the cage operation is valid
@@ -104,32 +175,146 @@ def parse_string(s):
                 "Expected {0} Got {1}".format(','.join(VALUE_CONSTRAINTS), op)
             )
 
-        cells = [Cell(*cell) for cell in cells]
+        cage_cells = []
+        for row, col in cells:
+            if not (0 <= row < puzzle_width and 0 <= col < puzzle_width):
+                raise Exception(
+                    'Cell {0} is outside the puzzle'.format((row, col))
+                )
+
+            index = row * puzzle_width + col
+            cell = grid[index]
+            if cell is not None:
+                # ensure that none of these cells has already been parsed
+                if cell not in cage_cells:
+                    raise Exception(
+                        'Some cells exist in another cage {0}'.format(cells)
+                    )
+                continue
+
+            cell = grid[index] = Cell(row, col)
+            cage_cells.append(cell)
 
         # create a "ValueCage"
         _class = constraint_factory[VALUE_CONSTRAINTS[op]]
-        puzzle_constraints.append(_class(cells, value))
-        puzzle_cells = puzzle_cells.union(cells)
+        puzzle_constraints.append(_class(cage_cells, value))
 
     # after looping over the puzzle cages, ensure all cells parsed
-    if len(puzzle_cells) != puzzle_width * puzzle_width:
+    parsed = sum(cell is not None for cell in grid)
+    if parsed != len(grid):
         raise Exception(
-            'Expected {0} cells; parsed {1}'.format(
-                puzzle_width * puzzle_width, puzzle_cells)
+            'Expected {0} cells; parsed {1}'.format(len(grid), parsed)
         )
 
     # add all unique constraints for the puzzle rows/columns
     for width in range(puzzle_width):
         puzzle_constraints.append(
             UniquenessConstraint(
-                [cell for cell in puzzle_cells if cell.row == width]
+                grid[width * puzzle_width:(width + 1) * puzzle_width]
             )
         )
 
         puzzle_constraints.append(
-            UniquenessConstraint(
-                [cell for cell in puzzle_cells if cell.col == width]
-            )
+            UniquenessConstraint(grid[width::puzzle_width])
         )
 
-    return Puzzle(puzzle_width, puzzle_cells, puzzle_constraints)
+    return Puzzle(puzzle_width, grid, puzzle_constraints)
+
+
+def iter_puzzles(lines):
+    """
+    Parses many puzzles, one per line
+
+    Each line may be in any format `parse_string` accepts, so JSON lines
+    files, files of .kk dictionaries written on a single line and compact
+    files all work. Blank lines and lines starting with '#' are skipped.
+
+    Args:
+        lines (iter): input lines, such as an open file
+
+    Returns: iter of `Puzzle` objects
+
+    """
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield parse_string(line)
+
+
+def parse_puzzles(filename):
+    """
+    Parses a file holding one puzzle per line
+
+    Args:
+        filename (str): input filename to open and read
+
+    Returns: list of `Puzzle` objects
+
+    """
+    with open(filename, 'r') as f:
+        return list(iter_puzzles(f))
+
+
+def dump_string(puzzle):
+    """
+    Formats a `Puzzle` object as a string that `parse_string` accepts
+
+    Only the cages are written; the row/column cages are recreated when
+    the string is parsed
+
+    Args:
+        puzzle (Puzzle): the puzzle to format
+
+    Returns: str
+
+    """
+    from puzzle import ValueConstraint
+
+    cages = [
+        {
+            'value': constraint.value,
+            'op': constraint.type,
+            'cells': sorted(cell.tuple for cell in constraint.cells)
+        }
+        for constraint in puzzle.constraints
+        if isinstance(constraint, ValueConstraint)
+    ]
+
+    return repr({'width': puzzle.width, 'cages': cages})
+
+
+def dump_json(puzzle):
+    """
+    Formats a `Puzzle` object as a JSON string that `parse_string` accepts
+
+    Args:
+        puzzle (Puzzle): the puzzle to format
+
+    Returns: str
+
+    """
+    return dump_string(puzzle).translate(REPR_TO_JSON)
+
+
+def dump_compact(puzzle):
+    """
+    Formats a `Puzzle` object in the compact format of `parse_compact`
+
+    Args:
+        puzzle (Puzzle): the puzzle to format
+
+    Returns: str
+
+    """
+    from puzzle import ValueConstraint
+
+    tokens = [str(puzzle.width)]
+    for constraint in puzzle.constraints:
+        if isinstance(constraint, ValueConstraint):
+            tokens.append('{0}{1}:{2}'.format(
+                constraint.type,
+                constraint.value,
+                ','.join(map(str, sorted(constraint.indices)))
+            ))
+
+    return ' '.join(tokens)
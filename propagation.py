@@ -0,0 +1,55 @@
+from collections import deque
+
+
+def propagate(constraints, trail, stats=None, conflicts=None, explain=None):
+    """
+    Runs generalized arc consistency (AC-3 over n-ary constraints) using a
+    worklist of constraints
+
+    Each constraint taken from the queue reduces the domains of its cells
+    through its `propagate` hook. Whenever a cell's domain is reduced,
+    the other constraints on that cell are queued again, until no
+    constraint can reduce any domain further.
+
+    See https://en.wikipedia.org/wiki/AC-3_algorithm for more information
+    on this algorithm
+
+    Args:
+        constraints (iter): `Constraint` objects to queue initially
+        trail (Trail): undo stack for domain reductions
+        stats (dict): optional stats; 'propagations' is incremented for
+                      every constraint taken from the queue
+        conflicts (list): optional list the constraint that left a cell
+                          without a possible value is appended to
+        explain (callable): optional function called with each constraint
+                            taken from the queue before it propagates
+
+    Returns: bool False if some cell was left without a possible value
+
+    """
+    queue = deque(constraints)
+    queued = set(queue)
+
+    while queue:
+        constraint = queue.popleft()
+        queued.discard(constraint)
+
+        if stats is not None:
+            stats['propagations'] += 1
+
+        if explain is not None:
+            explain(constraint)
+
+        changed = constraint.propagate(trail)
+        if changed is None:
+            if conflicts is not None:
+                conflicts.append(constraint)
+            return False
+
+        for cell in changed:
+            for other in cell.constraints:
+                if other is not constraint and other not in queued:
+                    queue.append(other)
+                    queued.add(other)
+
+    return True
@@ -1,11 +1,24 @@
 import argparse
 import glob
+import metrics
+import time
 
 from abc import ABC, abstractmethod
+from array import array
+from cache import open_cache
+from concurrent.futures import ProcessPoolExecutor
+from dlx import dlx_solve
 from formatter import AsciiPuzzleFormatter
+from functools import partial
+from ordering import VALUE_ORDERINGS, VARIABLE_ORDERINGS
+from parallel import parallel_solve
 from parsing import parse_file
-from solver import backtrack_solve
-from utils import product
+from restarts import restart_solve
+from sat import sat_solve, write_dimacs
+from solver import backtrack_solve, count_solutions
+from utils import iter_bits, percentile, product
+
+EMPTY_DOMAIN = frozenset()
 
 
 class Puzzle:
@@ -14,17 +27,30 @@ class Puzzle:
 
     See https://en.wikipedia.org/wiki/KenKen for more information
 
+    Cell values are stored in a single flat `values` array, where the cell
+    at (row, col) has the integer index row * width + col and 0 marks an
+    unassigned cell. `cells` is ordered by index, and each `Cell` is a
+    view on its slot of the array.
+
     Args:
         width (int): puzzle size
-        cells (list): `Cell` objects comprising this puzzle
+        cells (iter): `Cell` objects comprising this puzzle
         constraints (list): `Constraint` objects for the cells in this puzzle
 
     """
 
+    __slots__ = ('width', 'cells', 'constraints', 'values')
+
     def __init__(self, width, cells, constraints):
         self.width = width
-        self.cells = cells
+        self.cells = sorted(cells)
         self.constraints = constraints
+        self.values = array('b', bytes(width * width))
+
+        for cell in self.cells:
+            cell.bind(self.values, cell.row * width + cell.col)
+        for constraint in constraints:
+            constraint.bind()
 
     @property
     def domain(self):
@@ -34,13 +60,23 @@ class Puzzle:
         """
         return set(range(1, self.width + 1))
 
+    @property
+    def domain_mask(self):
+        """
+        Returns: int this puzzle's possible cell values as a bitmask, where
+                 bit `v` is set for each value `v` in the domain
+
+        """
+        return (1 << (self.width + 1)) - 2
+
     @property
     def unassigned(self):
         """
         Returns: iter the unassigned cells
 
         """
-        return filter(lambda cell: cell.value is None, self.cells)
+        values = self.values
+        return (cell for cell in self.cells if not values[cell.index])
 
     @property
     def solved(self):
@@ -63,34 +99,112 @@ class Cell:
     """
     Models a cell (two dimensional coordinate) in a kenken puzzle
 
+    The cell's value lives in slot `index` of a shared values array; a
+    new cell has an array of its own until a `Puzzle` binds it to the
+    puzzle's array. Assigning `value` notifies each of the cell's
+    constraints so that they can keep their running aggregates up to date
+
     Args:
         row (int): cell
         col (int): column
 
     """
 
-    domain = set()
+    __slots__ = ('row', 'col', 'index', 'values', 'constraints', 'domain',
+                 'domain_mask')
 
     def __init__(self, row, col):
-        self.tuple = row, col
-        self.value = None
+        self.row = row
+        self.col = col
+        self.index = 0
+        self.values = array('b', bytes(1))
         self.constraints = []
+        self.domain = EMPTY_DOMAIN
+        self.domain_mask = 0
+
+    def bind(self, values, index):
+        """
+        Moves this cell's value to slot `index` of a shared values array
+
+        The cell's constraints are frozen into a tuple, since the puzzle
+        owning the array is complete
+
+        Args:
+            values (array): the values array
+            index (int): this cell's slot
+
+        Returns: None
+
+        """
+        values[index] = self.values[self.index]
+        self.values = values
+        self.index = index
+        self.constraints = tuple(self.constraints)
 
     @property
-    def row(self):
+    def tuple(self):
         """
-        Returns: int
+        Returns: tuple (row, col)
+
+        """
+        return self.row, self.col
+
+    @property
+    def value(self):
+        """
+        Returns: int the value assigned to this cell, or None
+
+        """
+        return self.values[self.index] or None
+
+    @value.setter
+    def value(self, value):
+        """
+        Assigns (or unassigns, with None) this cell's value
+
+        Args:
+            value (int): new cell value
+
+        Returns: None
+
+        """
+        previous = self.values[self.index] or None
+        if previous == value:
+            return
+
+        self.values[self.index] = value or 0
+        for constraint in self.constraints:
+            if previous is not None:
+                constraint.unassign(previous)
+            if value is not None:
+                constraint.assign(value)
 
+    @property
+    def consistent(self):
         """
-        return self.tuple[0]
+        Returns: bool whether or not the constraints on this cell are
+                 consistent; after assigning this cell, these are the only
+                 constraints whose consistency may have changed
+
+        """
+        return all(c.consistent for c in self.constraints)
 
     @property
-    def col(self):
+    def candidate_mask(self):
         """
+        Computes and returns the possible values for this cell as a
+        bitmask, reduced from the cell domain mask by each of the
+        constraints on this cell
+
         Returns: int
 
         """
-        return self.tuple[1]
+        mask = self.domain_mask
+        for constraint in self.constraints:
+            if not mask:
+                break
+            mask = constraint.reduce_mask(self, mask)
+        return mask
 
     @property
     def candidates(self):
@@ -102,10 +216,7 @@ class Cell:
         Returns: set
 
         """
-        candidates = self.domain
-        for constraint in self.constraints:
-            candidates = candidates & set(constraint.reduce(candidates))
-        return candidates
+        return set(iter_bits(self.candidate_mask))
 
     def __str__(self) -> str:
         return str(self.tuple)
@@ -114,13 +225,13 @@ class Cell:
         return repr(self.tuple)
 
     def __eq__(self, other) -> bool:
-        return self.tuple == other.tuple
+        return self.row == other.row and self.col == other.col
 
     def __lt__(self, other) -> bool:
-        return self.tuple < other.tuple
+        return (self.row, self.col) < (other.row, other.col)
 
     def __hash__(self) -> int:
-        return hash(self.tuple)
+        return hash((self.row, self.col))
 
 
 class Constraint(ABC):
@@ -143,21 +254,81 @@ class Constraint(ABC):
     the constraint is satisfied.
     
     Further logic to reduce a set of candidate values for a constraint
-    may be implemented in the `reduce` method. The implementation for
-    that override should be deferred to the `reducer` dependency, rather
-    than included as part of the class.
+    may be implemented in the `reduce` method, and its bitmask counterpart
+    `reduce_mask`; the `propagate` method reduces the domains of all the
+    constraint's cells at once. The implementation for those overrides
+    should be deferred to the `reducer` dependency, rather than included
+    as part of the class.
+
+    Constraints keep running aggregates over their assigned cells, which
+    are updated in O(1) through `assign` and `unassign` whenever one of
+    their cells changes value. Subclasses extend `reset`, `assign` and
+    `unassign` to track whatever their `consistent` check needs.
+
+    Once the cells are bound to a puzzle, `indices` holds their integer
+    indices into the puzzle's values array.
 
     Args:
         cells (list): the `Cell` objects in this cage
 
     """
 
-    _reducer = None
+    __slots__ = ('cells', 'indices', '_reducer', '_count')
 
     def __init__(self, cells):
         self.cells = cells
+        self.indices = None
+        self._reducer = None
+        self.reset()
         for cell in cells:
             cell.constraints.append(self)
+            if cell.value is not None:
+                self.assign(cell.value)
+
+    def bind(self):
+        """
+        Records the indices of this constraint's cells, after they were
+        bound to a puzzle's values array
+
+        Returns: None
+
+        """
+        self.indices = array('H', [cell.index for cell in self.cells])
+
+    def reset(self):
+        """
+        Clears the running aggregates for this constraint
+
+        Returns: None
+
+        """
+        self._count = 0
+
+    def assign(self, value):
+        """
+        Updates the running aggregates after one of the cells in this
+        constraint is assigned
+
+        Args:
+            value (int): the assigned value
+
+        Returns: None
+
+        """
+        self._count += 1
+
+    def unassign(self, value):
+        """
+        Updates the running aggregates after one of the cells in this
+        constraint is unassigned
+
+        Args:
+            value (int): the value the cell held
+
+        Returns: None
+
+        """
+        self._count -= 1
 
     @abstractmethod
     def evaluate(self, values) -> bool:
@@ -214,6 +385,37 @@ class Constraint(ABC):
         """
         return candidates
 
+    def reduce_mask(self, cell, mask) -> int:
+        """
+        Reduces a bitmask of candidate values for one of this constraint's
+        cells
+
+        Args:
+            cell (Cell): the cell whose candidates are being reduced
+            mask (int): bitmask of candidate values
+
+        Returns: int the reduced bitmask
+
+        """
+        return mask
+
+    def propagate(self, trail):
+        """
+        Reduces the domains of this constraint's unassigned cells to the
+        values consistent with the other cells' values and domains
+
+        Reductions are made through `trail.reduce`, so that they can be
+        undone when the search backtracks
+
+        Args:
+            trail (Trail): undo stack for domain reductions
+
+        Returns: list the cells whose domains were reduced, or None if some
+                 cell was left without a possible value
+
+        """
+        return []
+
     @property
     def values(self):
         """
@@ -221,7 +423,11 @@ class Constraint(ABC):
                  this constraint
 
         """
-        return [cell.value for cell in self.cells]
+        if self.indices is None:
+            return [cell.value for cell in self.cells]
+
+        values = self.cells[0].values
+        return [values[index] or None for index in self.indices]
 
     @property
     def cardinality(self):
@@ -231,6 +437,14 @@ class Constraint(ABC):
         """
         return len(self.cells)
 
+    @property
+    def free(self):
+        """
+        Returns: int the number of cells whose values are unassigned
+
+        """
+        return len(self.cells) - self._count
+
     @property
     def unassigned(self):
         """
@@ -253,8 +467,7 @@ class Constraint(ABC):
         Returns: bool whether or not this constraint is solved
 
         """
-        values = self.values
-        return None not in values and self.evaluate(values)
+        return self._count == len(self.cells) and self.evaluate(self.values)
 
     @property
     def consistent(self):
@@ -262,11 +475,12 @@ class Constraint(ABC):
         Returns: bool whether or not this constraint is consistent
         
         """
-        # TODO improve this implementation in child classes
-        return None in self.values or self.solved
+        return self._count < len(self.cells) or self.evaluate(self.values)
 
 
 class UniquenessConstraint(Constraint):
+    __slots__ = ('_counts', '_seen', '_repeats')
+
     def evaluate(self, values) -> bool:
         """
         Returns whether `values` is unique
@@ -282,6 +496,48 @@ class UniquenessConstraint(Constraint):
     def reduce(self, candidates) -> set:
         return self.reducer.reduce_unique(self, candidates)
 
+    def reset(self):
+        super().reset()
+        self._counts = {}
+        self._seen = 0
+        self._repeats = 0
+
+    def assign(self, value):
+        super().assign(value)
+        count = self._counts.get(value, 0)
+        if count:
+            self._repeats += 1
+        else:
+            self._seen |= 1 << value
+        self._counts[value] = count + 1
+
+    def unassign(self, value):
+        super().unassign(value)
+        count = self._counts[value] - 1
+        if count:
+            self._repeats -= 1
+        else:
+            self._seen &= ~(1 << value)
+        self._counts[value] = count
+
+    @property
+    def seen(self) -> int:
+        """
+        Returns: int bitmask of the values assigned in this constraint
+
+        """
+        return self._seen
+
+    @property
+    def consistent(self):
+        return not self._repeats
+
+    def reduce_mask(self, cell, mask) -> int:
+        return self.reducer.reduce_unique_mask(self, cell, mask)
+
+    def propagate(self, trail):
+        return self.reducer.propagate_unique(self, trail)
+
 
 class ValueConstraint(Constraint):
     """
@@ -303,6 +559,8 @@ class ValueConstraint(Constraint):
     TYPE_DIV = '/'
     TYPE_CON = '$'
 
+    __slots__ = ('value',)
+
     def __init__(self, cells, value):
         super().__init__(cells)
         self.value = value
@@ -321,6 +579,8 @@ class ValueConstraint(Constraint):
 
 
 class AddConstraint(ValueConstraint):
+    __slots__ = ('_total',)
+
     def evaluate(self, values) -> bool:
         """
         Returns whether `values` sums to the target value
@@ -336,9 +596,35 @@ class AddConstraint(ValueConstraint):
     def reduce(self, candidates) -> set:
         return self.reducer.reduce_add(self, candidates)
 
+    def reset(self):
+        super().reset()
+        self._total = 0
+
+    def assign(self, value):
+        super().assign(value)
+        self._total += value
+
+    def unassign(self, value):
+        super().unassign(value)
+        self._total -= value
+
+    @property
+    def consistent(self):
+        free = self.free
+        if free:
+            # every unassigned cell adds at least one to the total
+            return self._total + free <= self.value
+        return self._total == self.value
+
+    def reduce_mask(self, cell, mask) -> int:
+        return self.reducer.reduce_add_mask(self, cell, mask)
+
+    def propagate(self, trail):
+        return self.reducer.propagate_add(self, trail)
+
     @property
     def total(self) -> int:
-        return sum(cell.value for cell in self.assigned)
+        return self._total
 
     @property
     def remainder(self) -> int:
@@ -350,6 +636,8 @@ class AddConstraint(ValueConstraint):
 
 
 class MulConstraint(ValueConstraint):
+    __slots__ = ('_total',)
+
     def evaluate(self, values) -> bool:
         """
         Returns whether `values` multiplies to the target value
@@ -365,9 +653,33 @@ class MulConstraint(ValueConstraint):
     def reduce(self, candidates) -> set:
         return self.reducer.reduce_mul(self, candidates)
 
+    def reset(self):
+        super().reset()
+        self._total = 1
+
+    def assign(self, value):
+        super().assign(value)
+        self._total *= value
+
+    def unassign(self, value):
+        super().unassign(value)
+        self._total //= value
+
+    @property
+    def consistent(self):
+        if self.free:
+            return self.value % self._total == 0
+        return self._total == self.value
+
+    def reduce_mask(self, cell, mask) -> int:
+        return self.reducer.reduce_mul_mask(self, cell, mask)
+
+    def propagate(self, trail):
+        return self.reducer.propagate_mul(self, trail)
+
     @property
     def total(self) -> int:
-        return product(cell.value for cell in self.assigned)
+        return self._total
 
     @property
     def remainder(self) -> int:
@@ -379,6 +691,8 @@ class MulConstraint(ValueConstraint):
 
 
 class SubConstraint(ValueConstraint):
+    __slots__ = ()
+
     def evaluate(self, values) -> bool:
         """
         Returns whether `values` multiplies to the target value
@@ -394,12 +708,20 @@ class SubConstraint(ValueConstraint):
     def reduce(self, candidates) -> set:
         return self.reducer.reduce_sub(self, candidates)
 
+    def reduce_mask(self, cell, mask) -> int:
+        return self.reducer.reduce_sub_mask(self, cell, mask)
+
+    def propagate(self, trail):
+        return self.reducer.propagate_sub(self, trail)
+
     @property
     def type(self) -> str:
         return self.TYPE_SUB
 
 
 class DivConstraint(ValueConstraint):
+    __slots__ = ()
+
     def evaluate(self, values) -> bool:
         """
         Returns whether `values` divides to the target value
@@ -416,12 +738,20 @@ class DivConstraint(ValueConstraint):
     def reduce(self, candidates) -> set:
         return self.reducer.reduce_div(self, candidates)
 
+    def reduce_mask(self, cell, mask) -> int:
+        return self.reducer.reduce_div_mask(self, cell, mask)
+
+    def propagate(self, trail):
+        return self.reducer.propagate_div(self, trail)
+
     @property
     def type(self) -> str:
         return self.TYPE_DIV
 
 
 class ConConstraint(ValueConstraint):
+    __slots__ = ()
+
     def evaluate(self, values) -> bool:
         """
         Returns whether `values` is the current value
@@ -437,6 +767,12 @@ class ConConstraint(ValueConstraint):
     def reduce(self, candidates) -> set:
         return self.reducer.reduce_con(self, candidates)
 
+    def reduce_mask(self, cell, mask) -> int:
+        return self.reducer.reduce_con_mask(self, cell, mask)
+
+    def propagate(self, trail):
+        return self.reducer.propagate_con(self, trail)
+
     @property
     def type(self) -> str:
         return self.TYPE_CON
@@ -450,6 +786,116 @@ VALUE_CONSTRAINTS = {
     ValueConstraint.TYPE_CON: ConConstraint.__name__,
 }
 
+SOLVERS = {
+    'backtrack': backtrack_solve,
+    'dlx': dlx_solve,
+    'parallel': parallel_solve,
+    'restart': restart_solve,
+    'sat': sat_solve,
+}
+
+# solvers running `solver.Search`, which accept its options such as the
+# `max_nodes`, `deadline` and `cancel` budgets and the orderings
+BUDGETED_SOLVERS = {'backtrack', 'parallel', 'restart'}
+
+
+def solve_file(filename, solver='backtrack', cache=None, options=None):
+    """
+    Parses and solves a puzzle file
+
+    Args:
+        filename (str): input .kk filename
+        solver (str): one of the keys of SOLVERS
+        cache (str): optional solution cache database filename
+        options (dict): optional keyword arguments for the solver
+
+    Returns: dict with the 'filename', whether or not it was 'solved', the
+             solver 'stats', the parse and solve time in 'seconds' and the
+             formatted solution as 'output'
+
+    """
+    solve = SOLVERS[solver]
+    if options:
+        solve = partial(solve, **options)
+
+    ts = time.perf_counter()
+    puzzle = parse_file(filename)
+    if cache is None:
+        solved, stats = solve(puzzle)
+    else:
+        solved, stats = open_cache(cache).solve(puzzle, solve)
+    te = time.perf_counter()
+
+    return {
+        'filename': filename,
+        'solved': solved,
+        'stats': stats,
+        'seconds': te - ts,
+        'output': AsciiPuzzleFormatter(puzzle).format() if solved else None
+    }
+
+
+def solve_files(filenames, solver='backtrack', jobs=1, chunksize=None,
+                cache=None, options=None):
+    """
+    Parses and solves a batch of puzzle files, optionally spreading them
+    over a pool of worker processes
+
+    Files are submitted to the pool in chunks, and results are yielded in
+    the order of `filenames` regardless of which worker finishes first
+
+    Args:
+        filenames (list): input .kk filenames
+        solver (str): one of the keys of SOLVERS
+        jobs (int): number of worker processes; 1 solves in this process
+        chunksize (int): files per submitted chunk; by default about four
+                         chunks per worker
+        cache (str): optional solution cache database filename
+        options (dict): optional keyword arguments for the solver
+
+    Returns: iter of `solve_file` results
+
+    """
+    if jobs <= 1:
+        for filename in filenames:
+            yield solve_file(filename, solver, cache, options)
+        return
+
+    if chunksize is None:
+        chunksize = max(1, len(filenames) // (jobs * 4))
+
+    solvers = [solver] * len(filenames)
+    caches = [cache] * len(filenames)
+    options = [options] * len(filenames)
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(solve_file, filenames, solvers, caches,
+                                options, chunksize=chunksize)
+
+
+def throughput(results, seconds):
+    """
+    Summarizes a batch of `solve_file` results
+
+    Args:
+        results (list): `solve_file` results
+        seconds (float): wall clock time for the whole batch
+
+    Returns: dict with puzzle counts, puzzles per second and the
+             p50/p95/p99 per-puzzle latency in seconds
+
+    """
+    latencies = sorted(result['seconds'] for result in results)
+
+    return {
+        'puzzles': len(results),
+        'solved': sum(1 for result in results if result['solved']),
+        'seconds': seconds,
+        'puzzles_per_second': len(results) / seconds if seconds else None,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+    }
+
 
 def main():
     """
@@ -459,6 +905,15 @@ def main():
 
       -s=[file]: parse and solve the given puzzle (.kk) file
       -t|--test: run and benchmark all puzzles in the ./tests directory
+      --solver=[name]: solving backend, one of the keys of SOLVERS
+      --dimacs=[file]: write the CNF encoding of the -s puzzle to a file
+      -j|--jobs=[n]: number of worker processes for the -t benchmark
+      -c|--count=[n]: count the solutions of the -s puzzle, up to n
+      --cache=[file]: reuse solutions from a sqlite solution cache
+      --variable-order=[name]: cell ordering of the search solvers
+      --value-order=[name]: value ordering of the search solvers
+      --metrics=[file]: write solver metrics to a file when done
+      --metrics-format=[json|prometheus]: format of the metrics file
 
     Returns: None
 
@@ -477,28 +932,121 @@ def main():
         action='store_true'
     )
 
-    args = vars(parser.parse_args())
+    parser.add_argument(
+        '--solver',
+        help='solving backend to use',
+        choices=sorted(SOLVERS),
+        default='backtrack'
+    )
+
+    parser.add_argument(
+        '--dimacs',
+        help='write the CNF encoding of the puzzle to a DIMACS file'
+    )
+
+    parser.add_argument(
+        '-j', '--jobs',
+        help='number of worker processes for the test benchmark',
+        type=int,
+        default=1
+    )
+
+    parser.add_argument(
+        '-c', '--count',
+        help='count the solutions of the puzzle, stopping at this limit',
+        type=int
+    )
+
+    parser.add_argument(
+        '--cache',
+        help='sqlite file caching solutions across runs'
+    )
+
+    parser.add_argument(
+        '--variable-order',
+        help='how the search solvers choose the next cell to branch on',
+        choices=sorted(VARIABLE_ORDERINGS)
+    )
+
+    parser.add_argument(
+        '--value-order',
+        help='in which order the search solvers try candidate values',
+        choices=sorted(VALUE_ORDERINGS)
+    )
+
+    parser.add_argument(
+        '--backjumping',
+        help='jump back to the decisions behind each dead end in the search '
+             'solvers',
+        action='store_true'
+    )
 
-    def solve(filename):
-        puzzle = parse_file(filename)
+    parser.add_argument(
+        '--metrics',
+        help='write solver metrics collected in this process to a file'
+    )
 
-        solved, stats = backtrack_solve(puzzle)
-        formatter = AsciiPuzzleFormatter(puzzle)
+    parser.add_argument(
+        '--metrics-format',
+        help='format of the metrics file',
+        choices=sorted(metrics.SINKS),
+        default='json'
+    )
+
+    args = vars(parser.parse_args())
 
-        if solved:
-            print('SOLVED ' + filename)
-            print(stats)
-            print(formatter.format())
+    options = {
+        option: args[option]
+        for option in ('variable_order', 'value_order', 'backjumping')
+        if args[option] not in (None, False)
+    }
+    if options and args['solver'] not in BUDGETED_SOLVERS:
+        parser.error('--variable-order, --value-order and --backjumping need '
+                     'one of the {0} solvers'.format(
+                         ', '.join(sorted(BUDGETED_SOLVERS))))
+
+    if args['metrics']:
+        metrics.enable(metrics.SINKS[args['metrics_format']](args['metrics']))
+
+    def report(result):
+        if result['solved'] is None:
+            print('ABORTED ' + result['filename'])
+            print(result['stats'])
+        elif result['solved']:
+            print('SOLVED ' + result['filename'])
+            print(result['stats'])
+            print(result['output'])
         else:
-            print('FAILED TO SOLVE ' + filename)
+            print('FAILED TO SOLVE ' + result['filename'])
 
     if args['solve']:
-        solve(args['solve'])
+        if args['dimacs'] or args['count']:
+            puzzle = parse_file(args['solve'])
+
+        if args['dimacs']:
+            write_dimacs(puzzle, args['dimacs'])
+
+        if args['count']:
+            count = count_solutions(puzzle, args['count'], **options)
+            print('{0} solution(s), limit {1}'.format(count, args['count']))
+
+        report(solve_file(args['solve'], args['solver'], args['cache'],
+                          options))
 
     if args['test']:
-        tests = glob.glob('./puzzles/*.kk')
-        for file in tests:
-            solve(file)
+        tests = sorted(glob.glob('./puzzles/*.kk'))
+
+        ts = time.perf_counter()
+        results = []
+        for result in solve_files(tests, args['solver'], args['jobs'],
+                                  cache=args['cache'], options=options):
+            report(result)
+            results.append(result)
+        te = time.perf_counter()
+
+        print(throughput(results, te - ts))
+
+    metrics.disable()
 
 
 if __name__ == '__main__':
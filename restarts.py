@@ -0,0 +1,241 @@
+import random
+
+from itertools import count
+from ordering import VALUE_ORDERINGS, VARIABLE_ORDERINGS
+from solver import Search
+from utils import luby, with_timing
+
+
+def luby_limits(scale):
+    """
+    Returns: iter of node limits `scale` times the Luby sequence
+
+    """
+    return (scale * luby(i) for i in count(1))
+
+
+def geometric_limits(scale, factor=1.5):
+    """
+    Returns: iter of node limits growing geometrically from `scale` by
+             `factor`
+
+    """
+    return (int(scale * factor ** i) for i in count())
+
+
+RESTART_SCHEDULES = {
+    'luby': luby_limits,
+    'geometric': geometric_limits,
+}
+
+
+class NogoodStore:
+    """
+    Records the assignments refuted by aborted searches, so that the
+    searches after a restart do not explore them again
+
+    When a search is aborted, every value its decision stack already
+    tried and exhausted for a cell is refuted under the branching
+    decisions above that cell. Each nogood is stored as those decisions
+    (cell index, value) and the cell index and bitmask of the refuted
+    values. Decisions with a single candidate are left out, since they
+    follow from the ones above them.
+
+    A nogood is checked whenever one of its cells is assigned: once all
+    of its decisions hold, the refuted values are removed from the cell's
+    domain, or the assignment fails if the cell holds one of them.
+    Nogoods without decisions are applied to the domains when the search
+    is initialized.
+
+    See Lecoutre et al., "Recording and minimizing nogoods from restarts"
+    (JSAT 2007)
+
+    """
+
+    def __init__(self):
+        self.nogoods = []
+        self.units = {}
+        self.watches = {}
+
+    def __len__(self):
+        return len(self.nogoods)
+
+    def add(self, decisions, target, mask):
+        """
+        Adds a nogood
+
+        Args:
+            decisions (tuple): (cell index, value) assignments
+            target (int): index of the cell whose values are refuted
+            mask (int): bitmask of the refuted values
+
+        Returns: None
+
+        """
+        nogood = (decisions, target, mask)
+        self.nogoods.append(nogood)
+
+        if not decisions:
+            self.units[target] = self.units.get(target, 0) | mask
+
+        watches = self.watches
+        for literal in decisions:
+            watches.setdefault(literal, []).append(nogood)
+        value = 0
+        while mask >> value:
+            if mask >> value & 1:
+                watches.setdefault((target, value), []).append(nogood)
+            value += 1
+
+    def record(self, stack):
+        """
+        Records the nogoods of an aborted search
+
+        Args:
+            stack (list): the search's decision frames, each a list of the
+                          cell, the candidates left to try, the trail mark,
+                          the number of branching decisions, the initial
+                          candidates and the conflict set
+
+        Returns: None
+
+        """
+        decisions = []
+        for cell, remaining, _, _, candidates, _ in stack:
+            refuted = candidates & ~remaining & ~(1 << cell.value)
+            if refuted:
+                self.add(tuple(decisions), cell.index, refuted)
+            if candidates & (candidates - 1):
+                decisions.append((cell.index, cell.value))
+
+    def start(self, puzzle):
+        """
+        Removes the values refuted without decisions from the cell domains
+
+        Args:
+            puzzle (Puzzle): the puzzle being searched
+
+        Returns: bool False if some domain was wiped out
+
+        """
+        cells = puzzle.cells
+        for target, mask in self.units.items():
+            cell = cells[target]
+            if cell.value is not None:
+                if mask >> cell.value & 1:
+                    return False
+                continue
+
+            cell.domain_mask &= ~mask
+            if not cell.domain_mask:
+                return False
+        return True
+
+    def check(self, cell, puzzle, trail):
+        """
+        Applies the nogoods watching a newly assigned cell
+
+        Args:
+            cell (Cell): the cell that was just assigned
+            puzzle (Puzzle): the puzzle being searched
+            trail (Trail): undo stack for domain reductions
+
+        Returns: list the cells whose domains were reduced, or None if the
+                 assignment violates a nogood
+
+        """
+        values, cells = puzzle.values, puzzle.cells
+
+        reduced = []
+        for decisions, target, mask in self.watches.get(
+                (cell.index, cell.value), ()):
+            if any(values[index] != value for index, value in decisions):
+                continue
+
+            if values[target]:
+                if mask >> values[target] & 1:
+                    return None
+                continue
+
+            other = cells[target]
+            domain = other.domain_mask
+            if domain & mask:
+                domain &= ~mask
+                if not domain:
+                    return None
+                trail.reduce(other, domain)
+                reduced.append(other)
+
+        return reduced
+
+
+@with_timing
+def restart_solve(puzzle, schedule='luby', scale=None, seed=0,
+                  max_nodes=None, variable_order='domwdeg',
+                  value_order='support', **options):
+    """
+    Solves a kenken puzzle with randomized backtracking searches, each
+    restarted after a growing number of nodes
+
+    Orderings break ties at random, so each restart explores a different
+    part of the search tree, which avoids getting stuck for long below a
+    bad early decision. The nogoods recorded by each aborted search, and
+    the dom/wdeg constraint weights, carry over to the next one. Since the
+    nogoods only exclude refuted assignments, a search that runs out of
+    candidates proves the puzzle has no solution.
+
+    Args:
+        puzzle `Puzzle`: object to solve
+        schedule (str): node limit schedule, one of the keys of
+                        RESTART_SCHEDULES
+        scale (int): node limit unit of the schedule; defaults to the
+                     number of cells, the nodes of a search that never
+                     backtracks
+        seed (int): seed of the random tie breaking
+        max_nodes (int): optional budget of search nodes over all restarts
+        variable_order (str): one of the keys of VARIABLE_ORDERINGS
+        value_order (str): one of the keys of VALUE_ORDERINGS
+        options (dict): other keyword arguments for `Search`
+
+    Returns: tuple where first position value is whether or not the puzzle
+             was solved, or None if a search budget aborted it; second is
+             some stats on the algorithm performance, summed over the
+             searches, with the number of 'restarts' and 'nogoods'
+
+    """
+    if scale is None:
+        scale = len(puzzle.cells)
+
+    rng = random.Random(seed)
+    nogoods = NogoodStore()
+    variable_order = VARIABLE_ORDERINGS[variable_order]()
+    value_order = VALUE_ORDERINGS[value_order]()
+
+    stats = {'restarts': 0}
+    for limit in RESTART_SCHEDULES[schedule](scale):
+        if max_nodes is not None:
+            limit = min(limit, max_nodes - stats.get('recursive_calls', 0))
+
+        search = Search(puzzle, max_nodes=limit,
+                        variable_order=variable_order,
+                        value_order=value_order, rng=rng, nogoods=nogoods,
+                        **options)
+        solved = search.initialize() and next(search.run(), None) is not None
+
+        for key, value in search.stats.items():
+            if key != 'aborted':
+                stats[key] = stats.get(key, 0) + value
+        stats['nogoods'] = len(nogoods)
+
+        if solved:
+            return True, stats
+        if search.aborted is None:
+            return False, stats
+
+        out_of_nodes = max_nodes is not None and \
+            stats['recursive_calls'] >= max_nodes
+        if search.aborted != 'max_nodes' or out_of_nodes:
+            stats['aborted'] = search.aborted
+            return None, stats
+
+        stats['restarts'] += 1
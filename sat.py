@@ -0,0 +1,568 @@
+import heapq
+import itertools
+
+from tables import build_tables
+from utils import luby, with_timing
+
+
+class CNF:
+    """
+    Models a boolean formula in conjunctive normal form
+
+    Variables are numbered from 1 and literals are signed variables, as
+    in the DIMACS format
+
+    Args:
+        num_vars (int): number of variables
+        clauses (list): clauses, each a list of literals
+
+    """
+
+    def __init__(self, num_vars=0, clauses=None):
+        self.num_vars = num_vars
+        self.clauses = clauses if clauses is not None else []
+
+    def new_var(self):
+        """
+        Returns: int a fresh variable
+
+        """
+        self.num_vars += 1
+        return self.num_vars
+
+    def add(self, clause):
+        """
+        Appends a clause to the formula
+
+        Args:
+            clause (iter): literals
+
+        Returns: None
+
+        """
+        self.clauses.append(list(clause))
+
+    def exactly_one(self, literals):
+        """
+        Appends clauses requiring exactly one of the literals to hold: one
+        at-least-one clause and pairwise at-most-one clauses
+
+        Args:
+            literals (list): literals
+
+        Returns: None
+
+        """
+        self.add(literals)
+        for first, second in itertools.combinations(literals, 2):
+            self.add((-first, -second))
+
+    def to_dimacs(self):
+        """
+        Returns: str the formula in DIMACS CNF format
+
+        """
+        lines = ['p cnf {0} {1}'.format(self.num_vars, len(self.clauses))]
+        for clause in self.clauses:
+            lines.append(' '.join(map(str, clause)) + ' 0')
+        return '\n'.join(lines) + '\n'
+
+
+class PuzzleEncoding:
+    """
+    Encodes a kenken puzzle as CNF
+
+    - every cell holds exactly one value (one-hot cell/value variables)
+    - every row and column holds every value exactly once
+    - every cage holds one of the allowed tuples from its combination
+      table: an auxiliary variable per tuple implies its cell values, at
+      least one tuple is chosen, and every cell value implies one of the
+      tuples that supports it
+
+    Args:
+        puzzle (Puzzle): the puzzle to encode
+
+    """
+
+    def __init__(self, puzzle):
+        self.puzzle = puzzle
+        self.cnf = CNF()
+
+        width = puzzle.width
+        self.cnf.num_vars = width ** 3
+
+        for cell in puzzle.cells:
+            self.cnf.exactly_one(
+                [self.var(cell.row, cell.col, v) for v in range(1, width + 1)]
+            )
+
+        for i, v in itertools.product(range(width), range(1, width + 1)):
+            self.cnf.exactly_one([self.var(i, j, v) for j in range(width)])
+            self.cnf.exactly_one([self.var(j, i, v) for j in range(width)])
+
+        for constraint, table in build_tables(puzzle).items():
+            self.encode_table(constraint, table)
+
+    def var(self, row, col, value):
+        """
+        Returns: int the variable for "the cell at (row, col) holds value"
+
+        """
+        width = self.puzzle.width
+        return (row * width + col) * width + value
+
+    def encode_table(self, constraint, table):
+        """
+        Appends the clauses for a cage's allowed tuples
+
+        Args:
+            constraint (ValueConstraint): the cage
+            table (CageTable): the cage's combination table
+
+        Returns: None
+
+        """
+        cnf = self.cnf
+        supports = {}
+        choices = []
+
+        for values in table.tuples:
+            choice = cnf.new_var()
+            choices.append(choice)
+            for cell, value in zip(constraint.cells, values):
+                literal = self.var(cell.row, cell.col, value)
+                cnf.add((-choice, literal))
+                supports.setdefault(literal, []).append(choice)
+
+        cnf.add(choices)
+
+        for cell in constraint.cells:
+            for value in range(1, self.puzzle.width + 1):
+                literal = self.var(cell.row, cell.col, value)
+                cnf.add([-literal] + supports.get(literal, []))
+
+    def decode(self, model):
+        """
+        Writes a satisfying assignment back into the puzzle's cells
+
+        Args:
+            model (list): truth value per variable, indexed by variable
+
+        Returns: None
+
+        """
+        width = self.puzzle.width
+        for cell in self.puzzle.cells:
+            for value in range(1, width + 1):
+                if model[self.var(cell.row, cell.col, value)]:
+                    cell.value = value
+                    break
+
+
+class CDCLSolver:
+    """
+    Conflict-driven clause learning SAT solver
+
+    - unit propagation with two watched literals per clause
+    - first-UIP conflict analysis, clause learning and non-chronological
+      backjumping
+    - VSIDS variable activities with phase saving for decisions
+    - restarts on a Luby schedule of conflicts
+
+    See https://en.wikipedia.org/wiki/Conflict-driven_clause_learning for
+    more information on this algorithm
+
+    Args:
+        cnf (CNF): formula to solve
+        restart_base (int): conflicts per unit of the Luby restart schedule
+
+    """
+
+    def __init__(self, cnf, restart_base=100):
+        n = cnf.num_vars
+        self.num_vars = n
+        self.restart_base = restart_base
+
+        self.clauses = []
+        self.watches = [[] for _ in range(2 * n + 2)]
+        self.values = [0] * (n + 1)
+        self.levels = [0] * (n + 1)
+        self.reasons = [None] * (n + 1)
+        self.trail = []
+        self.limits = []
+        self.head = 0
+
+        self.activity = [0.0] * (n + 1)
+        self.increment = 1.0
+        self.decay = 0.95
+        self.phase = [False] * (n + 1)
+        self.heap = [(0.0, var) for var in range(1, n + 1)]
+
+        self.stats = {
+            'decisions': 0,
+            'conflicts': 0,
+            'propagations': 0,
+            'learned': 0,
+            'restarts': 0
+        }
+
+        self.ok = True
+        for clause in cnf.clauses:
+            self.add_clause(clause)
+
+    @staticmethod
+    def index(literal):
+        """
+        Returns: int the watch list index of a literal
+
+        """
+        return 2 * literal if literal > 0 else 1 - 2 * literal
+
+    def value(self, literal):
+        """
+        Returns: int 1 if the literal is true, -1 if false, 0 if unassigned
+
+        """
+        value = self.values[abs(literal)]
+        return value if literal > 0 else -value
+
+    @property
+    def level(self):
+        """
+        Returns: int the current decision level
+
+        """
+        return len(self.limits)
+
+    def add_clause(self, clause):
+        """
+        Adds an input clause, before search
+
+        Args:
+            clause (iter): literals
+
+        Returns: None
+
+        """
+        clause = list(dict.fromkeys(clause))
+        if any(-literal in clause for literal in clause):
+            return
+
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            value = self.value(clause[0])
+            if value == -1:
+                self.ok = False
+            elif value == 0:
+                self.enqueue(clause[0], None)
+        else:
+            self.attach(clause)
+
+    def attach(self, clause):
+        """
+        Stores a clause and watches its first two literals
+
+        Args:
+            clause (list): literals
+
+        Returns: int the clause index
+
+        """
+        index = len(self.clauses)
+        self.clauses.append(clause)
+        self.watches[self.index(clause[0])].append(index)
+        self.watches[self.index(clause[1])].append(index)
+        return index
+
+    def enqueue(self, literal, reason):
+        """
+        Makes a literal true at the current decision level
+
+        Args:
+            literal (int): literal
+            reason (int): index of the clause implying it, None for decisions
+
+        Returns: None
+
+        """
+        var = abs(literal)
+        self.values[var] = 1 if literal > 0 else -1
+        self.levels[var] = self.level
+        self.reasons[var] = reason
+        self.trail.append(literal)
+
+    def propagate(self):
+        """
+        Runs unit propagation over the literals not yet propagated
+
+        For every literal made false, each clause watching it either finds
+        another non-false literal to watch, is already satisfied by its
+        other watch, or is unit and implies its other watch
+
+        Returns: int the index of a conflicting clause, or None
+
+        """
+        clauses, watches, values = self.clauses, self.watches, self.values
+
+        while self.head < len(self.trail):
+            false = -self.trail[self.head]
+            self.head += 1
+            self.stats['propagations'] += 1
+
+            watchers = watches[self.index(false)]
+            kept = 0
+            i = 0
+            count = len(watchers)
+
+            while i < count:
+                ci = watchers[i]
+                i += 1
+                clause = clauses[ci]
+
+                if clause[0] == false:
+                    clause[0], clause[1] = clause[1], false
+
+                first = clause[0]
+                value = values[abs(first)]
+                if (value if first > 0 else -value) == 1:
+                    watchers[kept] = ci
+                    kept += 1
+                    continue
+
+                for m in range(2, len(clause)):
+                    literal = clause[m]
+                    value = values[abs(literal)]
+                    if (value if literal > 0 else -value) != -1:
+                        clause[1], clause[m] = literal, false
+                        watches[self.index(literal)].append(ci)
+                        break
+                else:
+                    watchers[kept] = ci
+                    kept += 1
+
+                    value = values[abs(first)]
+                    if (value if first > 0 else -value) == -1:
+                        while i < count:
+                            watchers[kept] = watchers[i]
+                            kept += 1
+                            i += 1
+                        del watchers[kept:]
+                        return ci
+
+                    self.enqueue(first, ci)
+
+            del watchers[kept:]
+
+        return None
+
+    def bump(self, var):
+        """
+        Increases a variable's activity after it took part in a conflict
+
+        Args:
+            var (int): variable
+
+        Returns: None
+
+        """
+        self.activity[var] += self.increment
+        if self.activity[var] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.increment *= 1e-100
+            self.heap = [(-self.activity[v], v) for _, v in self.heap]
+            heapq.heapify(self.heap)
+        heapq.heappush(self.heap, (-self.activity[var], var))
+
+    def analyze(self, conflict):
+        """
+        Derives the first-UIP learned clause for a conflict
+
+        Args:
+            conflict (int): index of the conflicting clause
+
+        Returns: tuple of the learned clause, whose first literal is the
+                 asserting one, and the level to backjump to
+
+        """
+        seen = set()
+        learned = [None]
+        counter = 0
+        literal = None
+        clause = self.clauses[conflict]
+        index = len(self.trail) - 1
+
+        while True:
+            for q in clause:
+                var = abs(q)
+                if q == literal or var in seen or self.levels[var] == 0:
+                    continue
+
+                seen.add(var)
+                self.bump(var)
+                if self.levels[var] == self.level:
+                    counter += 1
+                else:
+                    learned.append(q)
+
+            while abs(self.trail[index]) not in seen:
+                index -= 1
+
+            literal = self.trail[index]
+            index -= 1
+            counter -= 1
+            if not counter:
+                break
+
+            seen.discard(abs(literal))
+            clause = self.clauses[self.reasons[abs(literal)]]
+
+        learned[0] = -literal
+
+        if len(learned) == 1:
+            return learned, 0
+
+        deepest = max(range(1, len(learned)),
+                      key=lambda i: self.levels[abs(learned[i])])
+        learned[1], learned[deepest] = learned[deepest], learned[1]
+        return learned, self.levels[abs(learned[1])]
+
+    def backjump(self, level):
+        """
+        Unassigns every literal above the given decision level, saving
+        their phases
+
+        Args:
+            level (int): decision level to keep
+
+        Returns: None
+
+        """
+        if self.level <= level:
+            return
+
+        limit = self.limits[level]
+        for literal in self.trail[limit:]:
+            var = abs(literal)
+            self.phase[var] = literal > 0
+            self.values[var] = 0
+            self.reasons[var] = None
+            heapq.heappush(self.heap, (-self.activity[var], var))
+
+        del self.trail[limit:]
+        del self.limits[level:]
+        self.head = limit
+
+    def decide(self):
+        """
+        Returns: int the unassigned variable with the highest activity, or
+                 None if every variable is assigned
+
+        """
+        while self.heap:
+            _, var = heapq.heappop(self.heap)
+            if not self.values[var]:
+                return var
+        return None
+
+    def solve(self):
+        """
+        Searches for a satisfying assignment
+
+        Returns: bool whether or not the formula is satisfiable
+
+        """
+        if not self.ok:
+            return False
+
+        restarts = 1
+        budget = luby(restarts) * self.restart_base
+
+        while True:
+            conflict = self.propagate()
+
+            if conflict is not None:
+                self.stats['conflicts'] += 1
+                if not self.level:
+                    return False
+
+                learned, level = self.analyze(conflict)
+                self.backjump(level)
+
+                if len(learned) == 1:
+                    self.enqueue(learned[0], None)
+                else:
+                    self.enqueue(learned[0], self.attach(learned))
+                self.stats['learned'] += 1
+                self.increment /= self.decay
+
+                budget -= 1
+                if budget <= 0:
+                    self.stats['restarts'] += 1
+                    restarts += 1
+                    budget = luby(restarts) * self.restart_base
+                    self.backjump(0)
+                continue
+
+            var = self.decide()
+            if var is None:
+                return True
+
+            self.stats['decisions'] += 1
+            self.limits.append(len(self.trail))
+            self.enqueue(var if self.phase[var] else -var, None)
+
+    @property
+    def model(self):
+        """
+        Returns: list truth value per variable, indexed by variable
+
+        """
+        return [value > 0 for value in self.values]
+
+
+def write_dimacs(puzzle, filename):
+    """
+    Writes a puzzle's CNF encoding to a DIMACS file, e.g. to hand it to an
+    external SAT solver
+
+    Args:
+        puzzle (Puzzle): the puzzle to encode
+        filename (str): output .cnf filename
+
+    Returns: `PuzzleEncoding` so that an external model can be decoded
+
+    """
+    encoding = PuzzleEncoding(puzzle)
+    with open(filename, 'w') as f:
+        f.write(encoding.cnf.to_dimacs())
+    return encoding
+
+
+@with_timing
+def sat_solve(puzzle):
+    """
+    Solves a kenken puzzle by encoding it to CNF and running the built-in
+    CDCL SAT solver
+
+    Args:
+        puzzle `Puzzle`: object to solve
+
+    Returns: tuple where first position value is whether or not the puzzle
+             was solved; second is some stats on the algorithm performance.
+             'backtracks' counts conflicts and 'recursive_calls' decisions
+
+    """
+    encoding = PuzzleEncoding(puzzle)
+    sat = CDCLSolver(encoding.cnf)
+    satisfiable = sat.solve()
+
+    stats = dict(sat.stats)
+    stats['backtracks'] = stats['conflicts']
+    stats['recursive_calls'] = stats['decisions']
+
+    if not satisfiable:
+        return False, stats
+
+    encoding.decode(sat.model)
+    return puzzle.solved, stats
@@ -0,0 +1,434 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from stream import solve_line
+from urllib.parse import parse_qs, urlsplit
+from utils import percentile
+
+STATUS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    504: 'Gateway Timeout',
+}
+
+
+def solve_batch(items, solver='backtrack'):
+    """
+    Solves a batch of puzzle lines in a worker process
+
+    Puzzles whose deadline passed while the batch was queued or running
+    are skipped, since nobody is waiting for their result anymore, and
+    solvers that support it give up at the deadline
+
+    Args:
+        items (list): (puzzle line, deadline as a `time.time()` timestamp)
+        solver (str): one of the keys of `puzzle.SOLVERS`
+
+    Returns: list of `stream.solve_line` results
+
+    """
+    from puzzle import BUDGETED_SOLVERS
+
+    budgeted = solver in BUDGETED_SOLVERS
+
+    results = []
+    for line, deadline in items:
+        if time.time() > deadline:
+            results.append({'error': 'deadline exceeded'})
+        else:
+            results.append(solve_line(
+                line, solver, deadline=deadline if budgeted else None
+            ))
+    return results
+
+
+class Request:
+    """
+    A puzzle waiting to be solved by the service
+
+    Args:
+        line (str): the puzzle
+        deadline (float): `time.time()` timestamp after which the result
+                          is no longer wanted
+        future (asyncio.Future): resolved with the `solve_line` result
+
+    """
+
+    __slots__ = ('line', 'deadline', 'future')
+
+    def __init__(self, line, deadline, future):
+        self.line = line
+        self.deadline = deadline
+        self.future = future
+
+
+class SolveService:
+    """
+    Solves puzzles for concurrent clients with a pool of worker processes
+
+    Requests are queued and dispatched to the pool by a single batcher
+    task. Whenever a worker is free, the batcher takes the oldest request
+    and adds any others already queued (or arriving within `batch_delay`)
+    until the batch holds `batch_size` puzzles or `batch_chars` characters
+    of puzzle text, so small puzzles share a single dispatch while large
+    ones go alone. Each request has a deadline: waiting clients give up
+    when it passes, requests that expired before their batch runs are
+    skipped by the worker, and budgeted solvers abort at the deadline.
+
+    Args:
+        solver (str): one of the keys of `puzzle.SOLVERS`
+        jobs (int): number of worker processes; defaults to the CPU count
+        timeout (float): default seconds before a request expires
+        batch_size (int): maximum puzzles per dispatch
+        batch_chars (int): maximum puzzle text per dispatch
+        batch_delay (float): seconds to wait for more puzzles to batch
+
+    """
+
+    def __init__(self, solver='backtrack', jobs=None, timeout=10.0,
+                 batch_size=32, batch_chars=8192, batch_delay=0.002):
+        self.solver = solver
+        self.jobs = jobs or os.cpu_count()
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.batch_chars = batch_chars
+        self.batch_delay = batch_delay
+
+        self.executor = None
+        self.in_flight = 0
+        self.queue = None
+        self.slots = None
+        self.batcher = None
+
+        self.latencies = deque(maxlen=1000)
+        self.counters = {
+            'requests': 0,
+            'solved': 0,
+            'unsolved': 0,
+            'aborted': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'batches': 0,
+            'batched': 0,
+        }
+
+    async def start(self):
+        """
+        Starts the worker pool and the batcher task
+
+        Workers are started up front from a fork server with the solver
+        modules preloaded, so that requests never pay for process startup
+        and workers do not inherit the client connections of the service
+
+        Returns: None
+
+        """
+        context = None
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['puzzle', 'stream'])
+
+        self.executor = ProcessPoolExecutor(max_workers=self.jobs,
+                                            mp_context=context)
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self.executor, solve_batch, [], self.solver)
+            for _ in range(self.jobs)
+        ))
+
+        self.in_flight = 0
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(self.jobs)
+        self.batcher = asyncio.create_task(self.batch())
+
+    async def stop(self):
+        """
+        Stops the batcher task and shuts the worker pool down
+
+        Returns: None
+
+        """
+        self.batcher.cancel()
+        try:
+            await self.batcher
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown(cancel_futures=True)
+
+    async def batch(self):
+        """
+        Batcher task: groups queued requests and dispatches them as soon as
+        a worker is free
+
+        Returns: None
+
+        """
+        loop = asyncio.get_running_loop()
+
+        while True:
+            await self.slots.acquire()
+            batch = [await self.queue.get()]
+            chars = len(batch[0].line)
+
+            window = loop.time() + self.batch_delay
+            while len(batch) < self.batch_size and chars < self.batch_chars:
+                try:
+                    request = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    remaining = window - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        request = await asyncio.wait_for(self.queue.get(),
+                                                         remaining)
+                    except asyncio.TimeoutError:
+                        break
+
+                batch.append(request)
+                chars += len(request.line)
+
+            asyncio.create_task(self.dispatch(batch))
+
+    async def dispatch(self, batch):
+        """
+        Solves a batch in the worker pool and resolves its requests
+
+        Args:
+            batch (list): `Request` objects
+
+        Returns: None
+
+        """
+        try:
+            live = [request for request in batch if not request.future.done()]
+            if not live:
+                return
+
+            self.counters['batches'] += 1
+            self.counters['batched'] += len(live)
+            self.in_flight += 1
+
+            loop = asyncio.get_running_loop()
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, solve_batch,
+                    [(request.line, request.deadline) for request in live],
+                    self.solver
+                )
+            except Exception as e:
+                results = [{'error': repr(e)}] * len(live)
+            finally:
+                self.in_flight -= 1
+
+            for request, result in zip(live, results):
+                if not request.future.done():
+                    request.future.set_result(result)
+        finally:
+            self.slots.release()
+
+    async def solve(self, line, timeout=None):
+        """
+        Solves a puzzle, waiting at most `timeout` seconds
+
+        Args:
+            line (str): the puzzle, in any format `parse_string` accepts
+            timeout (float): seconds before the request expires
+
+        Returns: dict a `stream.solve_line` result, or None if the request
+                 expired
+
+        """
+        timeout = self.timeout if timeout is None else timeout
+        ts = time.perf_counter()
+        self.counters['requests'] += 1
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(Request(line, time.time() + timeout, future))
+
+        try:
+            result = await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            return None
+        finally:
+            self.latencies.append(time.perf_counter() - ts)
+
+        if 'error' in result:
+            self.counters['errors'] += 1
+        else:
+            self.counters[result['status']] += 1
+        return result
+
+    def metrics(self):
+        """
+        Returns: dict of the request counters, the current 'queue_depth'
+                 and number of batches 'in_flight', the mean batch size
+                 and the p50/p95/p99 latency in seconds over the last
+                 1000 requests
+
+        """
+        latencies = sorted(self.latencies)
+        batches = self.counters['batches']
+        return dict(
+            self.counters,
+            queue_depth=self.queue.qsize(),
+            in_flight=self.in_flight,
+            mean_batch=self.counters['batched'] / batches if batches else None,
+            p50=percentile(latencies, 50),
+            p95=percentile(latencies, 95),
+            p99=percentile(latencies, 99),
+        )
+
+    async def respond(self, method, target, body):
+        """
+        Routes one HTTP request
+
+          POST /solve[?timeout=seconds]: solves the puzzle in the body
+          GET /metrics: returns the service metrics
+
+        Returns: tuple of the status code and the JSON response
+
+        """
+        url = urlsplit(target)
+
+        if url.path == '/metrics':
+            if method != 'GET':
+                return 405, {'error': 'use GET'}
+            return 200, self.metrics()
+
+        if url.path == '/solve':
+            if method != 'POST':
+                return 405, {'error': 'use POST'}
+
+            query = parse_qs(url.query)
+            try:
+                timeout = float(query['timeout'][0]) \
+                    if 'timeout' in query else None
+            except ValueError:
+                return 400, {'error': 'invalid timeout'}
+
+            result = await self.solve(body.decode(), timeout)
+            if result is None:
+                return 504, {'error': 'deadline exceeded'}
+            return (400 if 'error' in result else 200), result
+
+        return 404, {'error': 'not found'}
+
+    async def handle(self, reader, writer):
+        """
+        Serves the HTTP/1.1 requests of one client connection, keeping it
+        alive until the client closes it or asks to
+
+        Returns: None
+
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line.strip():
+                    break
+
+                method, target, _ = line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get('content-length', 0))
+                body = await reader.readexactly(length) if length else b''
+
+                status, response = await self.respond(method, target, body)
+                payload = json.dumps(response).encode()
+                close = headers.get('connection', '').lower() == 'close'
+
+                writer.write(
+                    'HTTP/1.1 {0} {1}\r\n'
+                    'Content-Type: application/json\r\n'
+                    'Content-Length: {2}\r\n'
+                    'Connection: {3}\r\n\r\n'.format(
+                        status, STATUS[status], len(payload),
+                        'close' if close else 'keep-alive'
+                    ).encode() + payload
+                )
+                await writer.drain()
+
+                if close:
+                    break
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8000, unix=None):
+        """
+        Runs the service until cancelled
+
+        Args:
+            host (str): TCP host to listen on
+            port (int): TCP port to listen on
+            unix (str): unix socket path to listen on instead of TCP
+
+        Returns: None
+
+        """
+        await self.start()
+        try:
+            if unix is not None:
+                server = await asyncio.start_unix_server(self.handle, unix)
+            else:
+                server = await asyncio.start_server(self.handle, host, port)
+
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+def main():
+    """
+    Command line interface for the solve service
+
+    Returns: None
+
+    """
+    from puzzle import SOLVERS
+
+    parser = argparse.ArgumentParser(description='kenken solve service')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix', help='listen on a unix socket instead')
+    parser.add_argument('--solver', choices=sorted(SOLVERS),
+                        default='backtrack')
+    parser.add_argument('-j', '--jobs', type=int)
+    parser.add_argument('--timeout', type=float, default=10.0,
+                        help='default request deadline in seconds')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--batch-chars', type=int, default=8192)
+    parser.add_argument('--batch-delay', type=float, default=0.002)
+
+    args = parser.parse_args()
+
+    service = SolveService(args.solver, args.jobs, args.timeout,
+                           args.batch_size, args.batch_chars,
+                           args.batch_delay)
+    try:
+        asyncio.run(service.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,14 @@
-from utils import flatten, pairs, with_timing
+import time
+
+from itertools import islice
+from metrics import active, key
+from ordering import VALUE_ORDERINGS, VARIABLE_ORDERINGS
+from propagation import propagate
+from tables import build_tables
+from utils import flatten, iter_bits, pairs, popcount, with_timing
+
+# number of search nodes between checks of the clock
+CHECK_INTERVAL = 256
 
 
 class ReductionStrategy:
@@ -117,76 +127,1190 @@ class ReductionStrategy:
         """
         return {constraint.value} if constraint.value in candidates else set()
 
+    @staticmethod
+    def reduce_unique_mask(constraint, cell, mask):
+        """
+        Reduces a candidate bitmask by the rules for a unique constraint
+
+        Args:
+            constraint (UniqueConstraint): constraint object
+            cell (Cell): cell whose candidates are reduced
+            mask (int): bitmask to reduce
+
+        Returns: int
+
+        """
+        return mask & ~constraint.seen
+
+    @staticmethod
+    def reduce_add_mask(constraint, cell, mask):
+        """
+        Reduces a candidate bitmask by the rules for an add constraint
+
+        Every other unassigned cell in the cage holds at least 1, so a
+        candidate can be no larger than the remainder less that amount
+
+        Args:
+            constraint (AddConstraint): constraint object
+            cell (Cell): cell whose candidates are reduced
+            mask (int): bitmask to reduce
+
+        Returns: int
+
+        """
+        remainder = constraint.remainder
+        free = constraint.free
+
+        if remainder <= 0:
+            return 0
+
+        if free <= 1:
+            return mask & (1 << remainder)
+
+        upper = remainder - (free - 1)
+        if upper <= 0:
+            return 0
+
+        return mask & ((1 << (upper + 1)) - 1)
+
+    @staticmethod
+    def reduce_mul_mask(constraint, cell, mask):
+        """
+        Reduces a candidate bitmask by the rules for a mul constraint
+
+        Args:
+            constraint (MulConstraint): constraint object
+            cell (Cell): cell whose candidates are reduced
+            mask (int): bitmask to reduce
+
+        Returns: int
+
+        """
+        total = constraint.total
+        if constraint.value % total:
+            return 0
+
+        remainder = constraint.value // total
+
+        if constraint.free <= 1:
+            return mask & (1 << remainder)
+
+        reduced = 0
+        for candidate in iter_bits(mask):
+            if remainder % candidate == 0:
+                reduced |= 1 << candidate
+        return reduced
+
+    @staticmethod
+    def reduce_sub_mask(constraint, cell, mask):
+        """
+        Reduces a candidate bitmask to the values that are at the target
+        distance from some candidate of the partner cell
+
+        Args:
+            constraint (SubConstraint): constraint object
+            cell (Cell): cell whose candidates are reduced
+            mask (int): bitmask to reduce
+
+        Returns: int
+
+        """
+        partner = partner_mask(constraint, cell)
+        difference = constraint.value
+        return mask & ((partner << difference) | (partner >> difference))
+
+    @staticmethod
+    def reduce_div_mask(constraint, cell, mask):
+        """
+        Reduces a candidate bitmask to the values that divide, or are
+        divided by, some candidate of the partner cell by the target
+
+        Args:
+            constraint (DivConstraint): constraint object
+            cell (Cell): cell whose candidates are reduced
+            mask (int): bitmask to reduce
+
+        Returns: int
+
+        """
+        quotient = constraint.value
+        allowed = 0
+        for value in iter_bits(partner_mask(constraint, cell)):
+            allowed |= 1 << (value * quotient)
+            if value % quotient == 0:
+                allowed |= 1 << (value // quotient)
+        return mask & allowed
+
+    @staticmethod
+    def reduce_con_mask(constraint, cell, mask):
+        """
+        Reduces a candidate bitmask to the constant constraint value
+
+        Args:
+            constraint (ConConstraint): constraint object
+            cell (Cell): cell whose candidates are reduced
+            mask (int): bitmask to reduce
+
+        Returns: int
+
+        """
+        return mask & (1 << constraint.value)
+
+    @staticmethod
+    def propagate_unique(constraint, trail):
+        """
+        Propagates a unique constraint to a fixpoint
+
+        - values of assigned cells and single-valued domains are removed
+          from the other domains
+        - if the cells can only hold as many values as there are cells,
+          every value must be used, so a value possible in just one cell
+          is fixed there
+        - fails when fewer values than unfixed cells remain
+
+        Args:
+            constraint (UniquenessConstraint): constraint object
+            trail (Trail): undo stack for domain reductions
+
+        Returns: list of reduced cells, or None on a wipeout
+
+        """
+        changed = []
+        cardinality = len(constraint.cells)
+
+        while True:
+            taken = 0
+            unfixed = []
+            for cell in constraint.cells:
+                if cell.value is not None:
+                    mask = 1 << cell.value
+                else:
+                    mask = cell.domain_mask
+
+                if mask & (mask - 1):
+                    unfixed.append(cell)
+                elif not mask or mask & taken:
+                    return None
+                else:
+                    taken |= mask
+
+            if not unfixed:
+                return changed
+
+            progress = False
+            once = twice = 0
+            for cell in unfixed:
+                mask = cell.domain_mask & ~taken
+                if mask != cell.domain_mask:
+                    if not mask:
+                        return None
+                    trail.reduce(cell, mask)
+                    changed.append(cell)
+                    progress = True
+                twice |= once & mask
+                once |= mask
+
+            if popcount(once) < len(unfixed):
+                return None
+
+            if popcount(once | taken) == cardinality:
+                hidden = once & ~twice
+                for cell in unfixed:
+                    single = cell.domain_mask & hidden
+                    if not single or single == cell.domain_mask:
+                        continue
+                    if single & (single - 1):
+                        return None
+                    trail.reduce(cell, single)
+                    changed.append(cell)
+                    progress = True
+
+            if not progress:
+                return changed
+
+    @staticmethod
+    def propagate_cells(constraint, trail):
+        """
+        Propagates a cage constraint by reducing the domain of each of its
+        unassigned cells with the constraint's `reduce_mask`
+
+        Args:
+            constraint (ValueConstraint): constraint object
+            trail (Trail): undo stack for domain reductions
+
+        Returns: list of reduced cells, or None on a wipeout
+
+        """
+        changed = []
+        for cell in constraint.cells:
+            if cell.value is not None:
+                continue
+
+            mask = cell.domain_mask
+            reduced = constraint.reduce_mask(cell, mask)
+            if reduced != mask:
+                if not reduced:
+                    return None
+                trail.reduce(cell, reduced)
+                changed.append(cell)
+        return changed
+
+    propagate_add = propagate_cells
+    propagate_mul = propagate_cells
+    propagate_sub = propagate_cells
+    propagate_div = propagate_cells
+    propagate_con = propagate_cells
+
+
+class TableReductionStrategy(ReductionStrategy):
+    """
+    Reduction strategy that prunes cage candidates exactly, keeping only
+    the values that appear in some allowed tuple of the cage's
+    precomputed combination table
+
+    Uniqueness constraints are reduced as in `ReductionStrategy`
+
+    Args:
+        tables (dict): `CageTable` objects keyed by constraint, as returned
+                       by `tables.build_tables`
+
+    """
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def reduce_table_mask(self, constraint, cell, mask):
+        """
+        Reduces a candidate bitmask to the values supported by the
+        constraint's combination table
+
+        Args:
+            constraint (ValueConstraint): constraint object
+            cell (Cell): cell whose candidates are reduced
+            mask (int): bitmask to reduce
+
+        Returns: int
+
+        """
+        return mask & self.tables[constraint].support(cell)
+
+    def propagate_table(self, constraint, trail):
+        """
+        Enforces generalized arc consistency on a cage: every remaining
+        value of every cage cell is supported by some allowed tuple that
+        is compatible with the other cells' values and domains
+
+        Args:
+            constraint (ValueConstraint): constraint object
+            trail (Trail): undo stack for domain reductions
+
+        Returns: list of reduced cells, or None on a wipeout
+
+        """
+        supports = self.tables[constraint].supports()
+
+        changed = []
+        for cell, support in zip(constraint.cells, supports):
+            if cell.value is not None:
+                if not support:
+                    return None
+                continue
+
+            mask = cell.domain_mask
+            reduced = mask & support
+            if reduced != mask:
+                if not reduced:
+                    return None
+                trail.reduce(cell, reduced)
+                changed.append(cell)
+        return changed
+
+    reduce_add_mask = reduce_table_mask
+    reduce_mul_mask = reduce_table_mask
+    reduce_sub_mask = reduce_table_mask
+    reduce_div_mask = reduce_table_mask
+
+    propagate_add = propagate_table
+    propagate_mul = propagate_table
+    propagate_sub = propagate_table
+    propagate_div = propagate_table
+
+
+class InstrumentedReductionStrategy(ReductionStrategy):
+    """
+    Wraps another reduction strategy to record, per constraint type, the
+    number and running time of its `reduce_mask` and `propagate` calls on
+    the 'reduce' and 'propagate' timers, and the candidates they prune on
+    the 'pruned' counter
+
+    Propagation timings include the reduce calls made while propagating.
+    Only the constraint hooks are wrapped: the set based `reduce` methods
+    are not used by the search.
+
+    Args:
+        reducer (ReductionStrategy): strategy to wrap
+        registry (metrics.Metrics): registry to record to
+
+    """
+
+    TYPES = ('unique', 'add', 'mul', 'sub', 'div', 'con')
+
+    def __init__(self, reducer, registry):
+        self.reducer = reducer
+        self.registry = registry
+
+        for kind in self.TYPES:
+            name = 'reduce_{0}_mask'.format(kind)
+            setattr(self, name, self.timed_reduce(
+                getattr(reducer, name),
+                key('reduce', constraint=kind),
+                key('pruned', constraint=kind)
+            ))
+
+            name = 'propagate_{0}'.format(kind)
+            setattr(self, name, self.timed_propagate(
+                getattr(reducer, name),
+                key('propagate', constraint=kind),
+                key('pruned', constraint=kind)
+            ))
+
+    def timed_reduce(self, reduce_mask, timer, pruned):
+        """
+        Returns: callable `reduce_mask` recording its calls
+
+        """
+        registry = self.registry
+
+        def reduce(constraint, cell, mask):
+            ts = time.perf_counter()
+            reduced = reduce_mask(constraint, cell, mask)
+            registry.timing(timer, time.perf_counter() - ts)
+            if reduced != mask:
+                registry.incr(pruned, popcount(mask) - popcount(reduced))
+            return reduced
+
+        return reduce
+
+    def timed_propagate(self, propagate, timer, pruned):
+        """
+        Returns: callable `propagate` recording its calls; the pruned
+                 candidates are counted from the trail entries it adds
+
+        """
+        registry = self.registry
+
+        def timed(constraint, trail):
+            mark = trail.mark
+            ts = time.perf_counter()
+            changed = propagate(constraint, trail)
+            registry.timing(timer, time.perf_counter() - ts)
+
+            if trail.mark > mark:
+                before = {}
+                for cell, mask, *_ in trail.entries[mark:]:
+                    before.setdefault(cell, mask)
+                registry.incr(pruned, sum(
+                    popcount(mask) - popcount(cell.domain_mask)
+                    for cell, mask in before.items()
+                ))
+            return changed
+
+        return timed
+
+
+def partner_mask(constraint, cell):
+    """
+    Returns the possible values of the other cell in a two cell cage as a
+    bitmask: its value if assigned, otherwise its domain
+
+    Args:
+        constraint (Constraint): two cell constraint
+        cell (Cell): the cell whose partner to look up
+
+    Returns: int
+
+    """
+    first, second = constraint.cells
+    partner = second if first is cell else first
+
+    if partner.value is not None:
+        return 1 << partner.value
+    return partner.domain_mask
+
+
+class Trail:
+    """
+    Undo stack for the cell domain reductions made during search
+
+    Every reduction records the cell's previous domain mask, so the search
+    can restore all domains to an earlier state by undoing back to a mark
+    taken before an assignment
+
+    """
+
+    def __init__(self):
+        self.entries = []
+
+    @property
+    def mark(self):
+        """
+        Returns: int a position in the trail that can be passed to `undo`
+
+        """
+        return len(self.entries)
+
+    def reduce(self, cell, mask):
+        """
+        Replaces a cell's domain mask, recording the previous one
+
+        Args:
+            cell (Cell): cell whose domain is reduced
+            mask (int): the new domain mask
+
+        Returns: None
+
+        """
+        self.entries.append((cell, cell.domain_mask))
+        cell.domain_mask = mask
+
+    def undo(self, mark):
+        """
+        Restores every domain reduced since the given mark
+
+        Args:
+            mark (int): trail position returned by `mark`
+
+        Returns: None
+
+        """
+        entries = self.entries
+        while len(entries) > mark:
+            cell, mask = entries.pop()
+            cell.domain_mask = mask
+
+
+class ExplainedTrail(Trail):
+    """
+    Trail that also records why each cell's domain was reduced, for
+    conflict-directed backjumping
+
+    The reason of a cell is a bitmask of the search levels whose
+    decisions caused the reductions of its domain. Every reduction adds
+    the current `cause` to the reason of the reduced cell, and undoing it
+    restores the previous reason.
+
+    Args:
+        size (int): number of puzzle cells
 
-@with_timing
-def backtrack_solve(puzzle):
     """
-    Solves a kenken puzzle with backtracking
+
+    def __init__(self, size):
+        super().__init__()
+        self.reasons = [0] * size
+        self.cause = 0
+
+    def reduce(self, cell, mask):
+        """
+        Replaces a cell's domain mask, recording the previous one and its
+        reason, and adds the current cause to its reason
+
+        Args:
+            cell (Cell): cell whose domain is reduced
+            mask (int): the new domain mask
+
+        Returns: None
+
+        """
+        reasons, index = self.reasons, cell.index
+        self.entries.append((cell, cell.domain_mask, reasons[index]))
+        cell.domain_mask = mask
+        reasons[index] |= self.cause
+
+    def undo(self, mark):
+        """
+        Restores every domain and reason changed since the given mark
+
+        Args:
+            mark (int): trail position returned by `mark`
+
+        Returns: None
+
+        """
+        entries, reasons = self.entries, self.reasons
+        while len(entries) > mark:
+            cell, mask, reason = entries.pop()
+            cell.domain_mask = mask
+            reasons[cell.index] = reason
+
+
+def forward_check(cell, trail, conflicts=None, explain=None):
+    """
+    Prunes the domains of the unassigned cells that share a constraint with
+    a newly assigned cell, recording the reductions on the trail
+
+    Args:
+        cell (Cell): the cell that was just assigned
+        trail (Trail): undo stack for the reductions
+        conflicts (list): optional list the constraint that emptied a
+                          domain is appended to
+        explain (callable): optional function called with each constraint
+                            before it reduces the neighbours' domains
+
+    Returns: bool False if some neighbour's domain became empty
+
+    """
+    for constraint in cell.constraints:
+        if explain is not None:
+            explain(constraint)
+        for other in constraint.cells:
+            if other.value is not None:
+                continue
+
+            mask = other.domain_mask
+            reduced = constraint.reduce_mask(other, mask)
+            if reduced != mask:
+                if not reduced:
+                    if conflicts is not None:
+                        conflicts.append(constraint)
+                    return False
+                trail.reduce(other, reduced)
+    return True
+
+
+def branching(mask):
+    """
+    Returns: int 1 if the candidate bitmask holds more than one value,
+             meaning that choosing among them is a branching decision
+
+    """
+    return 1 if mask & (mask - 1) else 0
+
+
+class Search:
+    """
+    Models a backtracking search over a kenken puzzle
 
     During each iteration of the algorithm, a filtering strategy is applied
     to the puzzle's remaining unassigned cells
 
+    The search keeps its own stack of decisions rather than recursing, so
+    the puzzle size is not bounded by the interpreter's recursion limit
+
     See https://en.wikipedia.org/wiki/Backtracking for more information
     on this algorithm
 
     Args:
         puzzle `Puzzle`: object to solve
+        incremental (bool): after each trial assignment, only re-check the
+                            constraints on the assigned cell rather than
+                            every constraint in the puzzle
+        tables (bool): prune cage candidates exactly with precomputed
+                       cage combination tables
+        forward_checking (bool): keep pruned cell domains between nodes,
+                                 pruning the neighbours of each assigned
+                                 cell and failing as soon as one of their
+                                 domains is wiped out
+        propagation (bool): maintain arc consistency; propagate every
+                            constraint before search and, after each
+                            assignment, propagate from the assigned
+                            cell's constraints until a fixpoint. This
+                            prunes at least as much as forward checking,
+                            which it replaces
+        max_nodes (int): optional budget of search nodes (counted by
+                         'recursive_calls'); the search gives up once it
+                         is exceeded
+        deadline (float): optional `time.time()` timestamp after which the
+                          search gives up
+        cancel (object): optional cancellation token, such as a
+                         `threading.Event`; the search gives up once its
+                         `is_set()` returns True
+        metrics (metrics.Metrics): optional registry to record the
+                                   reducer calls, 'consistency_checks' and
+                                   the 'search_depth' of every node to;
+                                   defaults to the active registry, if any
+        trace (tracing.Tracer): optional tracer recording every decision,
+                                assignment, failure and backtrack
+        variable_order (str): how to choose the next cell to branch on,
+                              one of the keys of VARIABLE_ORDERINGS, or a
+                              `VariableOrdering` object, which keeps what
+                              it learned across searches
+        value_order (str): in which order to try a cell's candidates, one
+                           of the keys of VALUE_ORDERINGS, or a
+                           `ValueOrdering` object
+        rng (random.Random): optional random number generator the
+                             orderings break their ties with
+        nogoods (restarts.NogoodStore): optional nogoods to prune with, and
+                                        to record the refuted assignments
+                                        to when the search is aborted
+        backjumping (bool): on a dead end, jump straight back to the
+                            deepest decision responsible for the conflict
+                            instead of the previous one (conflict-directed
+                            backjumping)
 
-    Returns: tuple where first position value is whether or not the puzzle
-             was solved; second is some stats on the algorithm performance
+    With backjumping, the search tracks for every cell the levels of the
+    decisions that reduced its domain, through the constraints that
+    reduced it (see `ExplainedTrail`), and for every decision frame the
+    conflict set of the levels responsible for the failures of its
+    values. A frame that runs out of values jumps back to the deepest
+    level of its conflict set, or ends the search if it is empty. The
+    'backtracks' stat then counts jumps, and 'skipped_levels' the
+    decision levels they jumped over.
+
+    When the search gives up, `aborted` and the 'aborted' stat are set to
+    the reason: 'max_nodes', 'deadline' or 'cancelled'. The node budget
+    and the token are checked on every node, the deadline only every
+    CHECK_INTERVAL nodes; both are also checked before and after building
+    the cage tables, ahead of the initial propagation.
 
     """
 
-    stats = {
-        'backtracks': 0,
-        'recursive_calls': 0
-    }
+    def __init__(self, puzzle, incremental=True, tables=True,
+                 forward_checking=True, propagation=True, max_nodes=None,
+                 deadline=None, cancel=None, metrics=None, trace=None,
+                 variable_order='mrv', value_order='min', rng=None,
+                 nogoods=None, backjumping=False):
+        self.puzzle = puzzle
+        self.incremental = incremental
+        self.tables = tables
+        self.forward_checking = forward_checking
+        self.propagation = propagation
+        self.max_nodes = max_nodes
+        self.deadline = deadline
+        self.cancel = cancel
+        self.aborted = None
+        self.metrics = metrics if metrics is not None else active()
+        self.trace = trace
+        self.rng = rng
+        self.nogoods = nogoods
+        self.cage_tables = None
+
+        if isinstance(variable_order, str):
+            variable_order = VARIABLE_ORDERINGS[variable_order]()
+        if isinstance(value_order, str):
+            value_order = VALUE_ORDERINGS[value_order]()
+        self.variable_order = variable_order
+        self.value_order = value_order
+
+        self.backjumping = backjumping
+        tracked = trace is not None or self.variable_order.conflicts
+        self.conflicts = [] if tracked or backjumping else None
 
-    def initialize():
+        self.live_domains = forward_checking or propagation
+        self.stats = {
+            'backtracks': 0,
+            'recursive_calls': 0,
+            'propagations': 0
+        }
+
+        if backjumping:
+            self.trail = ExplainedTrail(len(puzzle.cells))
+            self.levels = [-1] * len(puzzle.cells)
+            self.stats['skipped_levels'] = 0
+        else:
+            self.trail = Trail()
+            self.levels = None
+
+    def initialize(self):
         """
         Initializes puzzle cell domains and sets the constraint reducer algorithm
         for all the constraints in the puzzle
 
-        Returns: None
+        With forward checking, each cell domain is then reduced once by its
+        constraints, since search only prunes the domains from there on;
+        with propagation, the puzzle is then made arc consistent
+
+        Returns: bool False if the puzzle is found to have no solution, or
+                 if the deadline or the token aborted the search
 
         """
+        puzzle = self.puzzle
+        if self.overdue():
+            return False
+
+        domain, domain_mask = puzzle.domain, puzzle.domain_mask
         for cell in puzzle.cells:
-            cell.domain = puzzle.domain
+            cell.domain = domain
+            cell.domain_mask = domain_mask
+
+        if self.tables:
+            self.cage_tables = build_tables(puzzle)
+            reducer = TableReductionStrategy(self.cage_tables)
+        else:
+            reducer = ReductionStrategy()
+
+        if self.metrics is not None:
+            reducer = InstrumentedReductionStrategy(reducer, self.metrics)
 
         for constraint in puzzle.constraints:
-            constraint.reducer = ReductionStrategy()
+            constraint.reducer = reducer
+
+        if self.live_domains:
+            for cell in puzzle.cells:
+                if cell.value is None:
+                    cell.domain_mask = cell.candidate_mask
+
+            if self.nogoods is not None and not self.nogoods.start(puzzle):
+                return False
+
+        if self.overdue():
+            return False
+
+        if self.trace is not None:
+            self.trace.start(puzzle)
+        self.variable_order.start(self)
+        self.value_order.start(self)
+
+        if self.propagation:
+            if not propagate(puzzle.constraints, self.trail, self.stats,
+                             self.conflicts):
+                if self.conflicts is not None:
+                    self.failed(None)
+                return False
+        return True
+
+    def candidates(self, cell):
+        """
+        Args:
+            cell (Cell): an unassigned cell
+
+        Returns: int the candidate bitmask for `cell`; with forward checking
+                 or propagation its domain is already pruned by the
+                 assigned cells
+
+        """
+        if self.live_domains:
+            return cell.domain_mask
+        return cell.candidate_mask
+
+    def consistent(self, cell):
+        """
+        Args:
+            cell (Cell): the cell that was just assigned
+
+        Returns: bool whether or not the puzzle is still consistent
+
+        """
+        if self.incremental:
+            return cell.consistent
+        return self.puzzle.consistent
+
+    def prune(self, cell):
+        """
+        Prunes the cell domains after assigning `cell`
+
+        Args:
+            cell (Cell): the cell that was just assigned
+
+        Returns: bool False if some domain was wiped out
+
+        """
+        constraints = cell.constraints
+        explain = self.explain if self.backjumping else None
+
+        if self.nogoods is not None:
+            if explain is not None:
+                # nogoods hold below any of the decisions so far
+                self.trail.cause = (2 << self.levels[cell.index]) - 1
+            reduced = self.nogoods.check(cell, self.puzzle, self.trail)
+            if reduced is None:
+                return False
+            if reduced:
+                constraints = list(dict.fromkeys(
+                    constraint
+                    for other in [cell] + reduced
+                    for constraint in other.constraints
+                ))
+
+        if self.propagation:
+            return propagate(constraints, self.trail, self.stats,
+                             self.conflicts, explain)
+        if self.forward_checking:
+            return forward_check(cell, self.trail, self.conflicts, explain)
+        return True
+
+    def culprits(self, constraint):
+        """
+        Args:
+            constraint (Constraint): a constraint
+
+        Returns: int bitmask of the decision levels its current state
+                 depends on: the levels of its assigned cells and the
+                 reasons of its unassigned cells' domains
+
+        """
+        levels, reasons = self.levels, self.trail.reasons
+
+        culprits = 0
+        for index in constraint.indices:
+            level = levels[index]
+            culprits |= 1 << level if level >= 0 else reasons[index]
+        return culprits
+
+    def explain(self, constraint):
+        """
+        Makes the decision levels of a constraint the cause of the domain
+        reductions it is about to make
+
+        Returns: None
+
+        """
+        self.trail.cause = self.culprits(constraint)
+
+    def failed(self, cell):
+        """
+        Reports a failed assignment, with the constraint that failed it, to
+        the tracer and the variable ordering
+
+        Args:
+            cell (Cell): the cell that was just assigned, or None for a
+                         failure of the initial propagation
+
+        Returns: Constraint the constraint that failed the assignment, or
+                 None if it is not known
+
+        """
+        if self.conflicts:
+            constraint = self.conflicts.pop()
+        elif cell is None:
+            constraint = None
+        else:
+            constraints = cell.constraints if self.incremental \
+                else self.puzzle.constraints
+            constraint = next(
+                (c for c in constraints if not c.consistent), None
+            )
+
+        if self.trace is not None:
+            self.trace.fail(constraint)
+        self.variable_order.failed(constraint)
+        return constraint
+
+    def select(self):
+        """
+        Returns: Cell the unassigned cell to branch on, chosen by the
+                 variable ordering, or None if every cell is assigned
+
+        """
+        return self.variable_order.select(self)
+
+    def expired(self):
+        """
+        Checks the search budgets after a new search node
+
+        Returns: str the reason to give up the search, or None
+
+        """
+        nodes = self.stats['recursive_calls']
+        if self.max_nodes is not None and nodes > self.max_nodes:
+            return 'max_nodes'
+        if self.cancel is not None and self.cancel.is_set():
+            return 'cancelled'
+
+        if nodes % CHECK_INTERVAL == 0 and self.deadline is not None \
+                and time.time() > self.deadline:
+            return 'deadline'
 
-    def solve():
+        return None
+
+    def overdue(self):
+        """
+        Checks the deadline and the cancellation token outside of the search
+        loop, aborting the search if either has passed
+
+        Returns: bool whether or not the search was aborted
+
+        """
+        if self.deadline is not None and time.time() > self.deadline:
+            self.aborted = self.stats['aborted'] = 'deadline'
+        elif self.cancel is not None and self.cancel.is_set():
+            self.aborted = self.stats['aborted'] = 'cancelled'
+        return self.aborted is not None
+
+    def unwind(self, stack):
         """
-        Solve this puzzle recursively
+        Unassigns every cell on the search stack and restores the domains
 
-        - The algorithm sorts the unsolved cells by candidate length
-        - If the current assignment for a cell solves on recursing, the puzzle
-          must be solved
-        - Otherwise, none of the candidates solves the puzzle and we have to stop
-          and unassign everything, backing up to the origin of the inconsistency
+        Args:
+            stack (list): search frames
+
+        Returns: None
 
-        Returns: bool
+        """
+        for cell, *_ in stack:
+            cell.value = None
+            if self.levels is not None:
+                self.levels[cell.index] = -1
+        if stack:
+            self.trail.undo(stack[0][2])
+        stack.clear()
 
+    def backjump(self, stack, conflict):
         """
+        Pops a frame that ran out of values, and the frames above the
+        deepest decision in its conflict set
+
+        The frame's conflict set, with the reason of its cell's candidates,
+        holds every level responsible for the failure of all its values;
+        the remainder of it is added to the conflict set of the frame
+        jumped back to. An empty conflict set ends the search.
 
-        solve_order = sorted(puzzle.unassigned,
-                             key=lambda c: len(c.candidates))
+        Args:
+            stack (list): search frames; the top frame's cell is
+                          unassigned
 
-        for cell in solve_order:
-            for candidate in cell.candidates:
-                cell.value = candidate
+        Returns: None
+
+        """
+        cell = stack[-1][0]
+        level = len(stack) - 1
+        conflict |= self.trail.reasons[cell.index]
+        if not self.live_domains:
+            # the candidates left out the values of the assigned peers
+            for constraint in cell.constraints:
+                conflict |= self.culprits(constraint)
+        conflict &= ~(1 << level)
+        target = conflict.bit_length() - 1
+
+        stack.pop()
+        self.stats['skipped_levels'] += level - target - 1
+        if self.trace is not None:
+            self.trace.backtrack()
+
+        while len(stack) > target + 1:
+            cell, _, mark, *_ = stack.pop()
+            self.trail.undo(mark)
+            cell.value = None
+            self.levels[cell.index] = -1
+            if self.trace is not None:
+                self.trace.backtrack()
+
+        if stack:
+            stack[-1][5] |= conflict & ~(1 << target)
+            self.levels[stack[-1][0].index] = -1
+
+    def resume(self, stack):
+        """
+        Makes every frame's conflict set hold all the levels below it, so
+        that the search backs up chronologically from a solution and
+        enumerates every other one
+
+        Args:
+            stack (list): search frames
+
+        Returns: None
+
+        """
+        for level, frame in enumerate(stack):
+            frame[5] = (1 << level) - 1
+
+    def run(self, depth=None):
+        """
+        Runs the search iteratively, yielding at every solution
+
+        - The algorithm picks the unsolved cell with the fewest candidates
+          and pushes a frame of (cell, remaining candidates, trail mark,
+          number of branching decisions so far, initial candidates,
+          conflict set)
+        - The top frame tries its next remaining candidate; with forward
+          checking or propagation, each assignment prunes the cell domains
+          and fails immediately when one of them is emptied
+        - If the assignment is consistent, the next cell's frame is pushed,
+          and the puzzle is solved once no unassigned cell is left
+        - Otherwise, the trial is undone; a frame without remaining
+          candidates is popped, backing up to the previous decision, or
+          with backjumping to the deepest decision in its conflict set
+
+        The puzzle holds the solution while the generator is suspended at a
+        yield; resuming it continues the search for the next one. With a
+        `depth`, the search also yields at every consistent assignment of
+        `depth` branching decisions (cells that had more than one
+        candidate) instead of descending further, which enumerates the
+        independent subtrees at that depth.
+
+        Args:
+            depth (int): optional number of branching decisions to stop
+                         descending at
+
+        Returns: iter of the decided cells, in decision order
+
+        """
+        puzzle, stats, trace = self.puzzle, self.stats, self.trace
+        choose = self.value_order.choose
+        levels = self.levels
+        budgeted = self.max_nodes is not None or \
+            self.deadline is not None or self.cancel is not None
 
-                if puzzle.consistent:
-                    stats['recursive_calls'] += 1
-                    if solve():
-                        return True
+        depths = checks = None
+        if self.metrics is not None:
+            depths = self.metrics.histogram('search_depth')
+            checks = 'consistency_checks'
 
+        cell = self.select()
+        if cell is None:
+            if puzzle.solved:
+                if trace is not None:
+                    trace.solution()
+                yield []
+            return
+
+        if trace is not None:
+            trace.decide(cell)
+
+        remaining = self.candidates(cell)
+        stack = [[cell, remaining, self.trail.mark, branching(remaining),
+                  remaining, 0]]
+
+        while stack:
+            frame = stack[-1]
+            cell, remaining, mark, branches, _, conflict = frame
+
+            if cell.value is not None:
+                self.trail.undo(mark)
                 cell.value = None
 
-            stats['backtracks'] += 1
-            return False
-        return puzzle.solved
+            if not remaining:
+                stats['backtracks'] += 1
+                if levels is None:
+                    stack.pop()
+                    if trace is not None:
+                        trace.backtrack()
+                    continue
+
+                self.backjump(stack, conflict)
+                continue
+
+            candidate = choose(self, cell, remaining)
+            frame[1] = remaining & ~(1 << candidate)
+            cell.value = candidate
+            if levels is not None:
+                levels[cell.index] = len(stack) - 1
+
+            if trace is not None:
+                trace.assign(candidate)
+            if checks is not None:
+                self.metrics.incr(checks)
+            if not self.consistent(cell) or not self.prune(cell):
+                constraint = None
+                if self.conflicts is not None:
+                    constraint = self.failed(cell)
+                if levels is not None:
+                    frame[5] |= self.culprits(constraint) \
+                        if constraint is not None else (1 << len(stack)) - 1
+                    levels[cell.index] = -1
+                continue
+
+            stats['recursive_calls'] += 1
+            if depths is not None:
+                depths.observe(len(stack))
+            if budgeted:
+                reason = self.expired()
+                if reason is not None:
+                    self.aborted = stats['aborted'] = reason
+                    if trace is not None:
+                        trace.abort(reason)
+                    if self.nogoods is not None:
+                        self.nogoods.record(stack)
+                    self.unwind(stack)
+                    return
+
+            if branches == depth:
+                yield [entry[0] for entry in stack]
+                if levels is not None:
+                    self.resume(stack)
+                continue
+
+            cell = self.select()
+            if cell is None:
+                if puzzle.solved:
+                    if trace is not None:
+                        trace.solution()
+                    yield [entry[0] for entry in stack]
+                    if levels is not None:
+                        self.resume(stack)
+                continue
+
+            if trace is not None:
+                trace.decide(cell)
+
+            remaining = self.candidates(cell)
+            stack.append([cell, remaining, self.trail.mark,
+                          branches + branching(remaining), remaining, 0])
+
+
+@with_timing
+def backtrack_solve(puzzle, **options):
+    """
+    Solves a kenken puzzle with backtracking
+
+    See `Search` for the algorithm and its options
+
+    Args:
+        puzzle `Puzzle`: object to solve
+        options (dict): keyword arguments for `Search`
+
+    Returns: tuple where first position value is whether or not the puzzle
+             was solved, or None if the search was aborted by one of its
+             budgets before it could tell; second is some stats on the
+             algorithm performance, including the 'aborted' reason
+
+    """
+    search = Search(puzzle, **options)
+    solved = search.initialize() and next(search.run(), None) is not None
+    if not solved and search.aborted:
+        return None, search.stats
+    return solved, search.stats
+
+
+def iter_solutions(puzzle, **options):
+    """
+    Lazily enumerates the solutions of a kenken puzzle with backtracking
 
-    initialize()
-    return solve(), stats
+    Solutions are not copied: the puzzle itself is yielded and holds each
+    solution only until the generator is resumed, so callers that keep
+    solutions should snapshot the cell values. Once the generator is
+    exhausted or closed, the cells it assigned are unassigned again.
+
+    Args:
+        puzzle `Puzzle`: object to solve
+        options (dict): keyword arguments for `Search`
+
+    Returns: iter of `Puzzle`
+
+    """
+    search = Search(puzzle, **options)
+    if not search.initialize():
+        return
+
+    mark = search.trail.mark
+    decided = []
+    try:
+        for decided in search.run():
+            yield puzzle
+    finally:
+        for cell in decided:
+            cell.value = None
+        search.trail.undo(mark)
+
+
+def count_solutions(puzzle, limit=None, **options):
+    """
+    Counts the solutions of a kenken puzzle, stopping early at `limit`
+
+    Counting with a limit of 2 is the cheapest way to check that a puzzle
+    has a unique solution: the search stops as soon as a second one is
+    found. If the search is aborted by one of its budgets, the count is
+    only a lower bound.
+
+    Args:
+        puzzle `Puzzle`: object to solve
+        limit (int): optional number of solutions to stop counting at
+        options (dict): keyword arguments for `Search`
+
+    Returns: int the number of solutions, at most `limit`
+
+    """
+    solutions = iter_solutions(puzzle, **options)
+    try:
+        return sum(1 for _ in islice(solutions, limit))
+    finally:
+        solutions.close()
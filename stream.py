@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+from cache import open_cache
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from parsing import parse_string
+from tracing import Tracer
+
+
+def solve_line(line, solver='backtrack', cache=None, max_nodes=None,
+               timeout=None, deadline=None, trace=None):
+    """
+    Parses and solves one puzzle line
+
+    Args:
+        line (str): a puzzle in any format `parse_string` accepts
+        solver (str): one of the keys of `puzzle.SOLVERS`
+        cache (str): optional solution cache database filename
+        max_nodes (int): optional search node budget
+        timeout (float): optional seconds the solve may take
+        deadline (float): optional `time.time()` timestamp the solve must
+                          finish by
+        trace (str): optional filename to save a search trace to
+
+    The budgets are only supported by the BUDGETED_SOLVERS, and tracing by
+    the 'backtrack' solver.
+
+    Returns: dict with whether or not the puzzle was 'solved' (None when
+             a budget aborted the search), its 'status' ('solved',
+             'unsolved' or 'aborted'), the 'solution' rows, the solver
+             'stats' and the parse and solve time in 'seconds'; or with the
+             'error' if the line could not be parsed
+
+    """
+    from puzzle import SOLVERS
+
+    solve = SOLVERS[solver]
+
+    options = {}
+    if max_nodes is not None:
+        options['max_nodes'] = max_nodes
+    if timeout is not None:
+        deadline = min(deadline or float('inf'), time.time() + timeout)
+    if deadline is not None:
+        options['deadline'] = deadline
+    if trace is not None:
+        tracer = options['trace'] = Tracer()
+    if options:
+        solve = partial(solve, **options)
+
+    ts = time.perf_counter()
+    try:
+        puzzle = parse_string(line)
+    except Exception as e:
+        return {'error': '{0}: {1}'.format(type(e).__name__, e)}
+
+    if cache is None:
+        solved, stats = solve(puzzle)
+    else:
+        solved, stats = open_cache(cache).solve(puzzle, solve)
+    te = time.perf_counter()
+
+    if trace is not None and tracer.header is not None:
+        tracer.save(trace)
+
+    width, values = puzzle.width, puzzle.values
+    solution = [
+        list(values[row * width:(row + 1) * width]) for row in range(width)
+    ] if solved else None
+
+    if solved is None:
+        status = 'aborted'
+    else:
+        status = 'solved' if solved else 'unsolved'
+
+    return {
+        'solved': solved,
+        'status': status,
+        'solution': solution,
+        'stats': stats,
+        'seconds': te - ts
+    }
+
+
+def solve_stream(lines, solver='backtrack', jobs=1, buffer=None, cache=None,
+                 max_nodes=None, timeout=None, trace_dir=None,
+                 trace_sample=1.0):
+    """
+    Solves a stream of puzzles, one per line, lazily
+
+    Blank lines and lines starting with '#' are skipped. With several
+    jobs, at most `buffer` puzzles are in flight at once: the next line is
+    only read once the oldest result has been taken, so memory stays
+    bounded however long the input is and a slow consumer holds back the
+    reader. Results are yielded in input order.
+
+    Args:
+        lines (iter): input lines, such as an open file
+        solver (str): one of the keys of `puzzle.SOLVERS`
+        jobs (int): number of worker processes; 1 solves in this process
+        buffer (int): maximum puzzles in flight; defaults to four per job
+        cache (str): optional solution cache database filename
+        max_nodes (int): optional search node budget per puzzle
+        timeout (float): optional seconds each solve may take
+        trace_dir (str): optional directory to save search traces to, as
+                         'line<number>.kkt'
+        trace_sample (float): fraction of the puzzles to trace
+
+    Returns: iter of `solve_line` results, with the input 'line' number
+
+    """
+    worker = partial(solve_line, solver=solver, cache=cache,
+                     max_nodes=max_nodes, timeout=timeout)
+
+    def traced(number):
+        if trace_dir is None or random.random() >= trace_sample:
+            return None
+        return os.path.join(trace_dir, 'line{0}.kkt'.format(number))
+
+    numbered = (
+        (number, line)
+        for number, line in enumerate(lines, 1)
+        if line.strip() and not line.lstrip().startswith('#')
+    )
+
+    if jobs <= 1:
+        for number, line in numbered:
+            yield dict(line=number, **worker(line, trace=traced(number)))
+        return
+
+    buffer = buffer or 4 * jobs
+    pending = deque()
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        for number, line in numbered:
+            future = executor.submit(worker, line, trace=traced(number))
+            pending.append((number, future))
+            if len(pending) >= buffer:
+                number, future = pending.popleft()
+                yield dict(line=number, **future.result())
+
+        while pending:
+            number, future = pending.popleft()
+            yield dict(line=number, **future.result())
+
+
+def write_results(results, output):
+    """
+    Writes results as JSON lines, flushing after each one so that
+    downstream consumers see them as soon as they are ready
+
+    Args:
+        results (iter): JSON serializable results
+        output (file): text output stream
+
+    Returns: int the number of results written
+
+    """
+    count = 0
+    for result in results:
+        output.write(json.dumps(result) + '\n')
+        output.flush()
+        count += 1
+    return count
+
+
+def main():
+    """
+    Command line interface for the streaming solver
+
+    Reads puzzles, one per line, from a file or stdin and writes one JSON
+    result line per puzzle to a file or stdout
+
+    Returns: None
+
+    """
+    from puzzle import BUDGETED_SOLVERS, SOLVERS
+
+    parser = argparse.ArgumentParser(description='streaming kenken solver')
+    parser.add_argument('input', nargs='?', default='-',
+                        help='puzzle lines file; - reads stdin')
+    parser.add_argument('-o', '--output', default='-',
+                        help='results file; - writes stdout')
+    parser.add_argument('--solver', choices=sorted(SOLVERS),
+                        default='backtrack')
+    parser.add_argument('-j', '--jobs', type=int, default=1)
+    parser.add_argument('--buffer', type=int,
+                        help='maximum puzzles in flight')
+    parser.add_argument('--cache', help='sqlite solution cache file')
+    parser.add_argument('--max-nodes', type=int,
+                        help='search node budget per puzzle')
+    parser.add_argument('--timeout', type=float,
+                        help='seconds each solve may take')
+    parser.add_argument('--trace-dir',
+                        help='directory to save search traces to')
+    parser.add_argument('--trace-sample', type=float, default=1.0,
+                        help='fraction of the puzzles to trace')
+
+    args = parser.parse_args()
+
+    budgeted = args.max_nodes is not None or args.timeout is not None
+    if budgeted and args.solver not in BUDGETED_SOLVERS:
+        parser.error('--max-nodes and --timeout need one of the {0} '
+                     'solvers'.format(', '.join(sorted(BUDGETED_SOLVERS))))
+    if args.trace_dir is not None and args.solver != 'backtrack':
+        parser.error('--trace-dir needs the backtrack solver')
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    sink = sys.stdout if args.output == '-' else open(args.output, 'w')
+
+    try:
+        write_results(
+            solve_stream(source, args.solver, args.jobs, args.buffer,
+                         args.cache, args.max_nodes, args.timeout,
+                         args.trace_dir, args.trace_sample),
+            sink
+        )
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+
+if __name__ == '__main__':
+    main()
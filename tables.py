@@ -0,0 +1,236 @@
+from functools import lru_cache
+
+# number of cage shapes whose tuples are kept memoized; bounded so that a
+# long-running process solving many distinct puzzles does not grow forever
+TABLE_CACHE_SIZE = 4096
+
+
+class CageTable:
+    """
+    Models the allowed value tuples for a single cage constraint
+
+    Tuple positions follow the order of `constraint.cells`. Only tuples
+    whose values satisfy the cage operation and keep cells sharing a row
+    or column distinct are included, so a value with no supporting tuple
+    can never appear in the cage.
+
+    Args:
+        constraint (ValueConstraint): the cage this table belongs to
+        tuples (tuple): the allowed value tuples for the cage
+
+    """
+
+    def __init__(self, constraint, tuples):
+        self.constraint = constraint
+        self.tuples = tuples
+        self.bits = [tuple(1 << value for value in t) for t in tuples]
+        self.positions = {cell: i for i, cell in enumerate(constraint.cells)}
+        self._allowed = None
+        self._supports = None
+
+    def __len__(self):
+        return len(self.tuples)
+
+    def allowed(self):
+        """
+        Returns: list the current possible values of each cage cell as a
+                 bitmask; its value if assigned, otherwise its domain
+
+        """
+        return [
+            1 << cell.value if cell.value is not None else cell.domain_mask
+            for cell in self.constraint.cells
+        ]
+
+    def live(self, allowed=None):
+        """
+        Returns the bit tuples compatible with the given cell masks
+
+        Args:
+            allowed (list): possible values per position as bitmasks;
+                            defaults to `allowed()`
+
+        Returns: iter
+
+        """
+        if allowed is None:
+            allowed = self.allowed()
+
+        for bits in self.bits:
+            for bit, mask in zip(bits, allowed):
+                if not bit & mask:
+                    break
+            else:
+                yield bits
+
+    def supports(self, allowed=None):
+        """
+        Computes, for every cage position, the values that appear in at
+        least one tuple compatible with the current cell masks
+
+        The result for the last seen masks is cached, so reducing each of
+        the cage cells in turn scans the table only once
+
+        Args:
+            allowed (list): possible values per position as bitmasks;
+                            defaults to `allowed()`
+
+        Returns: list of bitmasks, one per cage position
+
+        """
+        if allowed is None:
+            allowed = self.allowed()
+
+        if allowed == self._allowed:
+            return self._supports
+
+        supports = [0] * len(allowed)
+        for bits in self.live(allowed):
+            for i, bit in enumerate(bits):
+                supports[i] |= bit
+
+        self._allowed, self._supports = allowed, supports
+        return supports
+
+    def support(self, cell):
+        """
+        Args:
+            cell (Cell): one of the cage cells
+
+        Returns: int bitmask of the values for `cell` that are supported
+                 by some compatible tuple
+
+        """
+        return self.supports()[self.positions[cell]]
+
+
+def cage_conflicts(cells):
+    """
+    Returns the pairs of cage positions whose cells share a row or column
+
+    Args:
+        cells (list): `Cell` objects of a cage
+
+    Returns: tuple of (i, j) pairs with i < j
+
+    """
+    return tuple(
+        (i, j)
+        for j, second in enumerate(cells)
+        for i, first in enumerate(cells[:j])
+        if first.row == second.row or first.col == second.col
+    )
+
+
+@lru_cache(maxsize=TABLE_CACHE_SIZE)
+def enumerate_tuples(op, target, size, width, conflicts):
+    """
+    Enumerates the value tuples for a cage of the given shape
+
+    Results are memoized, so cages of the same operation, target, size,
+    width and row/column overlap share one table across puzzles; the
+    TABLE_CACHE_SIZE least recently used shapes are kept
+
+    Args:
+        op (str): one of the `ValueConstraint` type identifiers
+        target (int): the cage target value
+        size (int): number of cells in the cage
+        width (int): puzzle width
+        conflicts (tuple): position pairs that must hold distinct values
+
+    Returns: tuple of value tuples
+
+    """
+    from puzzle import ValueConstraint
+
+    earlier = [[] for _ in range(size)]
+    for i, j in conflicts:
+        earlier[j].append(i)
+
+    values = [0] * size
+    tuples = []
+
+    def accepts(acc, value, remaining):
+        """
+        Returns whether a partial tuple can still reach the target
+
+        Args:
+            acc (int): running sum or product including `value`
+            value (int): value just placed
+            remaining (int): number of positions left to fill
+
+        Returns: bool
+
+        """
+        if op == ValueConstraint.TYPE_ADD:
+            return acc + remaining <= target <= acc + remaining * width
+        if op == ValueConstraint.TYPE_MUL:
+            return target % acc == 0 if remaining else acc == target
+        if op == ValueConstraint.TYPE_SUB:
+            return remaining or abs(values[0] - value) == target
+        if op == ValueConstraint.TYPE_DIV:
+            return remaining or (values[0] == value * target or
+                                 value == values[0] * target)
+        return value == target
+
+    def extend(position, acc):
+        """
+        Fills the tuple from `position` onwards, collecting every
+        complete tuple that reaches the target
+
+        Args:
+            position (int): next position to fill
+            acc (int): running sum or product of the filled positions
+
+        Returns: None
+
+        """
+        if position == size:
+            tuples.append(tuple(values))
+            return
+
+        for value in range(1, width + 1):
+            if any(values[i] == value for i in earlier[position]):
+                continue
+
+            if op == ValueConstraint.TYPE_MUL:
+                total = acc * value
+            else:
+                total = acc + value
+
+            if accepts(total, value, size - position - 1):
+                values[position] = value
+                extend(position + 1, total)
+
+        values[position] = 0
+
+    extend(0, 1 if op == ValueConstraint.TYPE_MUL else 0)
+    return tuple(tuples)
+
+
+def build_tables(puzzle):
+    """
+    Builds the combination table for every cage in a puzzle
+
+    Args:
+        puzzle (Puzzle): the puzzle whose cages to tabulate
+
+    Returns: dict of `CageTable` objects keyed by constraint
+
+    """
+    from puzzle import ValueConstraint
+
+    tables = {}
+    for constraint in puzzle.constraints:
+        if not isinstance(constraint, ValueConstraint):
+            continue
+
+        tuples = enumerate_tuples(
+            constraint.type,
+            constraint.value,
+            constraint.cardinality,
+            puzzle.width,
+            cage_conflicts(constraint.cells)
+        )
+        tables[constraint] = CageTable(constraint, tuples)
+    return tables
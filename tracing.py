@@ -0,0 +1,402 @@
+import argparse
+import json
+
+from collections import Counter
+
+MAGIC = b'KKTRACE1'
+
+# event kinds, stored in the low 3 bits of each event's varint
+DECIDE = 0     # a cell was selected for branching; payload: cell index
+ASSIGN = 1     # a value was tried for the selected cell; payload: value
+FAIL = 2       # the last assignment failed; payload: constraint id, 0 if
+               # unknown
+BACKTRACK = 3  # every value of the selected cell was tried
+SOLUTION = 4   # the puzzle was solved
+ABORT = 5      # a search budget ran out; payload: index in ABORT_REASONS
+
+ABORT_REASONS = ('max_nodes', 'deadline', 'cancelled')
+
+
+def write_varint(buffer, value):
+    """
+    Appends an unsigned LEB128 varint to a bytearray
+
+    Returns: None
+
+    """
+    while value > 0x7f:
+        buffer.append(value & 0x7f | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(buffer, offset):
+    """
+    Reads an unsigned LEB128 varint
+
+    Returns: tuple of the value and the offset after it
+
+    """
+    value = shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+def describe(constraint, width):
+    """
+    Returns: str a human readable description of a constraint, such as
+             '12+ (0,0) (0,1)' for a cage or 'row 3' and 'col 3' for a
+             uniqueness constraint
+
+    """
+    from puzzle import ValueConstraint
+
+    indices = sorted(constraint.indices)
+    if isinstance(constraint, ValueConstraint):
+        return '{0} {1}'.format(constraint, ' '.join(
+            '({0},{1})'.format(*divmod(index, width)) for index in indices
+        ))
+
+    if indices[-1] - indices[0] < width:
+        return 'row {0}'.format(indices[0] // width)
+    return 'col {0}'.format(indices[0] % width)
+
+
+class Tracer:
+    """
+    Records the decisions, value choices, failures and backtracks of a
+    backtracking search as a compact log of varint encoded events
+
+    Each event takes one byte when its payload is below 16 (values and
+    constraint ids of most puzzles) and two bytes for most cell indices,
+    so a trace stays small enough to record for sampled production
+    traffic. Pass a tracer as the `trace` option of `Search` or
+    `backtrack_solve`, then `save` it for `replay`.
+
+    """
+
+    __slots__ = ('header', 'events', 'ids')
+
+    def __init__(self):
+        self.header = None
+        self.events = bytearray()
+        self.ids = {}
+
+    def start(self, puzzle):
+        """
+        Starts a trace of a search over a puzzle, recording the puzzle and
+        a description of each of its constraints in the header
+
+        Returns: None
+
+        """
+        from parsing import dump_compact
+
+        self.header = {
+            'width': puzzle.width,
+            'puzzle': dump_compact(puzzle),
+            'constraints': [
+                describe(constraint, puzzle.width)
+                for constraint in puzzle.constraints
+            ],
+        }
+        self.ids = {
+            constraint: i for i, constraint in enumerate(puzzle.constraints, 1)
+        }
+        self.events.clear()
+
+    def decide(self, cell):
+        write_varint(self.events, cell.index << 3 | DECIDE)
+
+    def assign(self, value):
+        write_varint(self.events, value << 3 | ASSIGN)
+
+    def fail(self, constraint=None):
+        write_varint(self.events, self.ids.get(constraint, 0) << 3 | FAIL)
+
+    def backtrack(self):
+        self.events.append(BACKTRACK)
+
+    def solution(self):
+        self.events.append(SOLUTION)
+
+    def abort(self, reason):
+        write_varint(self.events, ABORT_REASONS.index(reason) << 3 | ABORT)
+
+    def dump(self):
+        """
+        Returns: bytes the trace: MAGIC, the varint length of the JSON
+                 header, the header and the events
+
+        """
+        header = json.dumps(self.header).encode()
+        prefix = bytearray(MAGIC)
+        write_varint(prefix, len(header))
+        return bytes(prefix) + header + self.events
+
+    def save(self, filename):
+        """
+        Writes the trace to a file
+
+        Returns: None
+
+        """
+        with open(filename, 'wb') as f:
+            f.write(self.dump())
+
+
+def load(data):
+    """
+    Splits a trace into its header and events
+
+    Args:
+        data (bytes): trace as returned by `Tracer.dump`
+
+    Returns: tuple of the header dict and the events bytes
+
+    """
+    if not data.startswith(MAGIC):
+        raise ValueError('not a search trace')
+
+    length, offset = read_varint(data, len(MAGIC))
+    header = json.loads(data[offset:offset + length].decode())
+    return header, data[offset + length:]
+
+
+def iter_events(events):
+    """
+    Decodes trace events
+
+    Args:
+        events (bytes): encoded events
+
+    Returns: iter of (kind, payload)
+
+    """
+    offset, end = 0, len(events)
+    while offset < end:
+        code, offset = read_varint(events, offset)
+        yield code & 7, code >> 3
+
+
+class Node:
+    """
+    A search tree node: the assignment of `value` to the cell with index
+    `cell`, under its `parent`'s assignments
+
+    `depth` counts the assignments above the node and `level` only those
+    that were branching choices, where the search tried more than one
+    value. `size` counts the assignments tried in the node's subtree,
+    itself included, and `failures` those that failed; `failure` is the
+    id of the constraint that failed the node's own assignment, if it did
+
+    """
+
+    __slots__ = ('cell', 'value', 'parent', 'children', 'failure',
+                 'solution', 'depth', 'level', 'size', 'failures')
+
+    def __init__(self, cell=None, value=None, parent=None):
+        self.cell = cell
+        self.value = value
+        self.parent = parent
+        self.children = []
+        self.failure = None
+        self.solution = False
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.level = 0
+        self.size = 1
+        self.failures = 0
+
+    def path(self, choices=False):
+        """
+        Args:
+            choices (bool): only include the branching choices
+
+        Returns: list of the (cell index, value) assignments from the root
+                 down to this node
+
+        """
+        path = []
+        node = self
+        while node.parent is not None:
+            if not choices or len(node.parent.children) > 1:
+                path.append((node.cell, node.value))
+            node = node.parent
+        return path[::-1]
+
+
+def replay(events):
+    """
+    Rebuilds the search tree of a trace
+
+    Args:
+        events (bytes): encoded events
+
+    Returns: tuple of the root `Node`, whose own failure is a failure of
+             the initial propagation, and the abort reason or None
+
+    """
+    root = Node()
+    nodes = []
+    stack = []
+    aborted = None
+
+    for kind, payload in iter_events(events):
+        if kind == DECIDE:
+            parent = stack[-1][2] if stack else root
+            stack.append([payload, parent, parent])
+        elif kind == ASSIGN:
+            cell, parent, _ = stack[-1]
+            node = Node(cell, payload, parent)
+            parent.children.append(node)
+            nodes.append(node)
+            stack[-1][2] = node
+        elif kind == FAIL:
+            node = stack[-1][2] if stack else root
+            node.failure = payload
+            node.failures = 1
+        elif kind == BACKTRACK:
+            stack.pop()
+        elif kind == SOLUTION:
+            (stack[-1][2] if stack else root).solution = True
+        elif kind == ABORT:
+            aborted = ABORT_REASONS[payload]
+
+    for node in reversed(nodes):
+        node.parent.size += node.size
+        node.parent.failures += node.failures
+
+    for node in nodes:
+        parent = node.parent
+        node.level = parent.level + (len(parent.children) > 1)
+
+    return root, aborted
+
+
+def walk(root):
+    """
+    Returns: iter of every node under `root`, depth first
+
+    """
+    stack = list(reversed(root.children))
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(reversed(node.children))
+
+
+def hottest(root, level=1, count=10):
+    """
+    Finds the largest subtrees rooted at a branching choice
+
+    Forced assignments, where the search only tried one value, do not
+    split the search tree, so subtrees are compared at the `level`-th
+    branching choice on their path
+
+    Args:
+        root (Node): replayed search tree
+        level (int): number of branching choices down to the subtree roots
+        count (int): number of subtrees to return
+
+    Returns: list of `Node` objects, largest subtree first
+
+    """
+    candidates = [
+        node for node in walk(root)
+        if node.level == level and len(node.parent.children) > 1
+    ]
+    return sorted(candidates, key=lambda node: -node.size)[:count]
+
+
+def failing(root):
+    """
+    Returns: Counter of how many assignments each constraint id failed,
+             including id 0 for failures of unknown cause
+
+    """
+    counts = Counter(node.failure for node in walk(root)
+                     if node.failure is not None)
+    if root.failure is not None:
+        counts[root.failure] += 1
+    return counts
+
+
+def summary(data, level=1, count=10):
+    """
+    Analyzes a search trace
+
+    Args:
+        data (bytes): trace as returned by `Tracer.dump`
+        level (int): branching level of the reported subtrees
+        count (int): number of subtrees and constraints to report
+
+    Returns: dict with the 'puzzle', the number of 'nodes' (assignments
+             tried), 'failures' and 'backtracks', the 'max_depth',
+             whether a 'solution' was found, the 'aborted' reason, the
+             'hottest' subtrees, by the branching choices leading to them,
+             and the most 'failing' constraints
+
+    """
+    header, events = load(data)
+    root, aborted = replay(events)
+    width = header['width']
+    names = ['unknown'] + header['constraints']
+
+    def cell(index):
+        return '({0},{1})'.format(*divmod(index, width))
+
+    nodes = list(walk(root))
+    return {
+        'puzzle': header['puzzle'],
+        'nodes': root.size - 1,
+        'failures': root.failures,
+        'backtracks': sum(1 for kind, _ in iter_events(events)
+                          if kind == BACKTRACK),
+        'max_depth': max((node.depth for node in nodes), default=0),
+        'solution': any(node.solution for node in nodes),
+        'aborted': aborted,
+        'hottest': [
+            {
+                'choices': ' '.join('{0}={1}'.format(cell(index), value)
+                                    for index, value in node.path(True)),
+                'nodes': node.size,
+                'failures': node.failures,
+            }
+            for node in hottest(root, level, count)
+        ],
+        'failing': [
+            {'constraint': names[constraint], 'failures': failures}
+            for constraint, failures in failing(root).most_common(count)
+        ],
+    }
+
+
+def main():
+    """
+    Command line interface to analyze search traces
+
+    Returns: None
+
+    """
+    parser = argparse.ArgumentParser(description='kenken search traces')
+    parser.add_argument('traces', nargs='+', help='trace files')
+    parser.add_argument('--level', type=int, default=1,
+                        help='branching level of the reported subtrees')
+    parser.add_argument('-n', '--count', type=int, default=10,
+                        help='number of subtrees and constraints reported')
+
+    args = parser.parse_args()
+
+    for filename in args.traces:
+        with open(filename, 'rb') as f:
+            report = summary(f.read(), args.level, args.count)
+        print(json.dumps(dict(trace=filename, **report), indent=2))
+
+
+if __name__ == '__main__':
+    main()
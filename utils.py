@@ -1,5 +1,6 @@
-import collections
+import collections.abc
 import itertools
+import metrics
 import time
 
 from functools import reduce, wraps
@@ -30,7 +31,7 @@ def flatten(iterable) -> iter:
 
     """
 
-    if isinstance(iterable, collections.Iterable):
+    if isinstance(iterable, collections.abc.Iterable):
         for item in iterable:
             yield from flatten(item)
     else:
@@ -50,30 +51,131 @@ def product(nums):
     return reduce(lambda x, y: x * y, nums, 1)
 
 
-def with_timing(f, output=print):
+def popcount(mask) -> int:
     """
-    Helper method to time and run a function and output the results
+    Returns the number of set bits in an integer bitmask
+
+    Args:
+        mask (int): bitmask
+
+    Returns: int
+
+    """
+    return bin(mask).count('1')
+
+
+def lowest_bit(mask) -> int:
+    """
+    Returns the position of the lowest set bit in an integer bitmask
+
+    Args:
+        mask (int): non-zero bitmask
+
+    Returns: int
+
+    """
+    return (mask & -mask).bit_length() - 1
+
+
+def iter_bits(mask) -> iter:
+    """
+    Iterates the positions of the set bits in an integer bitmask, lowest
+    bit first
+
+    Args:
+        mask (int): bitmask
+
+    Returns: iter
+
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def to_mask(values) -> int:
+    """
+    Returns the bitmask with the bit for each of the given values set
+
+    Args:
+        values (iter): non-negative integers
+
+    Returns: int
+
+    """
+    mask = 0
+    for value in values:
+        mask |= 1 << value
+    return mask
+
+
+def percentile(values, q):
+    """
+    Returns the q-th percentile of a sorted list by the nearest-rank method
+
+    Args:
+        values (list): sorted numbers
+        q (float): percentile, between 0 and 100
+
+    Returns: float or None if there are no values
+
+    """
+    if not values:
+        return None
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+
+def luby(i) -> int:
+    """
+    Returns the i-th term (1-based) of the Luby sequence
+    1, 1, 2, 1, 1, 2, 4, 1, 1, 2, ...
+
+    Args:
+        i (int): position in the sequence
+
+    Returns: int
+
+    """
+    k = 1
+    while (1 << k) - 1 < i:
+        k += 1
+
+    while (1 << k) - 1 != i:
+        i -= (1 << (k - 1)) - 1
+        k = 1
+        while (1 << k) - 1 < i:
+            k += 1
+
+    return 1 << (k - 1)
+
+
+def with_timing(f):
+    """
+    Decorates a function to record its running time on the 'solve' timer,
+    labelled with the function name, of the active metrics registry
+
+    While metrics are disabled, this only costs a registry lookup per call
 
     Args:
         f (callable): function to decorate
-        output (callable): function to output the time message
 
     Returns: callable decorated function
 
     """
+    name = metrics.key('solve', solver=f.__name__)
 
     @wraps(f)
     def timed(*args, **kwargs):
-        ts = time.time()
-        result = f(*args, **kwargs)
-        te = time.time()
-
-        message = 'func:{!r} args:[{!r}, {!r}] took: {:2.4f} sec'.format(
-            f.__name__, args, kwargs, te - ts
-        )
-
-        output(message)
+        registry = metrics.active()
+        if registry is None:
+            return f(*args, **kwargs)
 
-        return result
+        ts = time.perf_counter()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            registry.timing(name, time.perf_counter() - ts)
 
-    return timed
\ No newline at end of file
+    return timed